@@ -0,0 +1,320 @@
+"""
+Benchmark suite for the hot payment paths.
+
+Every benchmark builds its own synthetic data, inside a transaction that is rolled back
+once the suite is done, and records per-call latency percentiles and the peak memory
+allocated by one call. Compared against a saved baseline, a benchmark regresses when its
+median latency or its allocations grow by more than the threshold:
+
+    bench --site test.localhost run-payments-benchmarks --save-baseline benchmarks.json
+    bench --site test.localhost run-payments-benchmarks --baseline benchmarks.json --threshold 0.2
+
+Baselines are machine specific, save and compare them on the same runner.
+"""
+
+import contextlib
+import hashlib
+import hmac
+import json
+import math
+import time
+import tracemalloc
+
+import frappe
+
+BENCHMARKS = {}
+# metrics compared against the baseline, the rest is informational
+TRACKED_METRICS = ("p50_us", "alloc_peak_bytes")
+DEFAULT_THRESHOLD = 0.25
+SAMPLES = 50
+
+
+def benchmark(name, number):
+	"""Register a benchmark; the decorated function sets up and returns the callable to time.
+
+	Setup functions get an `ExitStack` to register their patches and cleanups on.
+
+	Args:
+	        name (str): Name the results and baseline are kept under
+	        number (int): Calls timed per sample
+	"""
+
+	def decorator(setup):
+		BENCHMARKS[name] = frappe._dict(name=name, number=number, setup=setup)
+		return setup
+
+	return decorator
+
+
+@contextlib.contextmanager
+def patched(obj, attribute, value):
+	original = getattr(obj, attribute, None)
+	setattr(obj, attribute, value)
+	try:
+		yield
+	finally:
+		setattr(obj, attribute, original)
+
+
+@benchmark("paymob_hmac_validation", number=2000)
+def paymob_hmac_validation(stack):
+	from payments.payment_gateways.paymob import hmac_validator
+
+	callback = {
+		"type": "TRANSACTION",
+		"obj": {
+			"amount_cents": 10000,
+			"created_at": "2025-01-01T10:00:00.000000",
+			"currency": "EGP",
+			"error_occured": False,
+			"has_parent_transaction": False,
+			"id": 192036465,
+			"integration_id": 4097558,
+			"is_3d_secure": True,
+			"is_auth": False,
+			"is_capture": False,
+			"is_refunded": False,
+			"is_standalone_payment": True,
+			"is_voided": False,
+			"order": {"id": 217503754},
+			"owner": 1820424,
+			"pending": False,
+			"source_data": {"pan": "2346", "sub_type": "MasterCard", "type": "card"},
+			"success": True,
+		},
+	}
+	secret = b"benchmark-secret"
+	stack.enter_context(patched(hmac_validator, "get_hmac_secret", lambda: secret))
+
+	fields = hmac_validator.HMAC_FIELDS[callback["type"]]
+	incoming_hmac = hmac_validator.calculate_hmac(
+		secret, hmac_validator.build_hmac_message(fields, callback["obj"])
+	)
+
+	def validate():
+		assert hmac_validator.HMACValidator(incoming_hmac=incoming_hmac, callback_dict=callback).is_valid
+
+	return validate
+
+
+@benchmark("razorpay_verify_signature", number=2000)
+def razorpay_verify_signature(stack):
+	body = json.dumps({"event": "payment.authorized", "payload": {"payment": {"entity": {"id": "pay_1"}}}})
+	secret = "benchmark-secret"
+	signature = hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+	settings = frappe.get_doc({"doctype": "Razorpay Settings"})
+
+	return lambda: settings.verify_signature(body, signature, secret)
+
+
+@benchmark("gocardless_authenticate_signature", number=2000)
+def gocardless_authenticate_signature(stack):
+	from werkzeug.test import EnvironBuilder
+	from werkzeug.wrappers import Request
+
+	from payments.payment_gateways.doctype import gocardless_settings
+
+	body = json.dumps({"events": [{"id": "EV1", "resource_type": "mandates", "action": "active"}]}).encode()
+	keys = ["other-secret", "benchmark-secret"]
+	signature = hmac.new(keys[-1].encode(), body, hashlib.sha256).hexdigest()
+	request = Request(
+		EnvironBuilder(method="POST", data=body, headers={"Webhook-Signature": signature}).get_environ()
+	)
+
+	stack.enter_context(patched(gocardless_settings, "get_webhook_keys", lambda: keys))
+	stack.enter_context(patched(frappe.local, "request", request))
+
+	def authenticate():
+		assert gocardless_settings.authenticate_signature(request)
+
+	return authenticate
+
+
+@benchmark("paytm_checksum", number=500)
+def paytm_checksum(stack):
+	from paytmchecksum import generateSignature
+
+	params = {
+		"MID": "BENCHMARK00000000000",
+		"WEBSITE": "WEBSTAGING",
+		"INDUSTRY_TYPE_ID": "Retail",
+		"CHANNEL_ID": "WEB",
+		"ORDER_ID": "ORDER00001",
+		"CUST_ID": "benchmark@example.com",
+		"EMAIL": "benchmark@example.com",
+		"TXN_AMOUNT": "100.00",
+		"CALLBACK_URL": "https://example.com/api/method/verify_transaction",
+	}
+
+	return lambda: generateSignature(params, "benchmarkkey1234")
+
+
+@benchmark("mpesa_split_request_amount", number=5000)
+def mpesa_split_request_amount(stack):
+	settings = frappe.get_doc({"doctype": "Mpesa Settings", "transaction_limit": 150})
+	args = frappe._dict(request_amount=1480)
+
+	return lambda: settings.split_request_amount_according_to_transaction_limit(args)
+
+
+@benchmark("mpesa_format_string_to_json", number=1000)
+def mpesa_format_string_to_json(stack):
+	from payments.payment_gateways.doctype.mpesa_settings.mpesa_settings import format_string_to_json
+
+	balance_info = "&".join(
+		f"{account}|KES|481000.00|481000.00|0.00|0.00"
+		for account in ("Working Account", "Float Account", "Utility Account", "Charges Paid Account")
+	)
+
+	return lambda: format_string_to_json(balance_info)
+
+
+@benchmark("mpesa_completed_integration_requests_info", number=50)
+def mpesa_completed_integration_requests_info(stack):
+	from payments.payment_gateways.doctype.mpesa_settings.mpesa_settings import (
+		get_completed_integration_requests_info,
+	)
+
+	reference_docname = f"benchmark-{frappe.generate_hash(length=10)}"
+	output = json.dumps(
+		{
+			"CallbackMetadata": {
+				"Item": [
+					{"Name": "Amount", "Value": 150},
+					{"Name": "MpesaReceiptNumber", "Value": "LGR7OWQX0R"},
+				]
+			}
+		}
+	)
+	now = frappe.utils.now()
+	frappe.db.bulk_insert(
+		"Integration Request",
+		(
+			"name",
+			"creation",
+			"modified",
+			"integration_request_service",
+			"status",
+			"reference_doctype",
+			"reference_docname",
+			"output",
+		),
+		[
+			(
+				f"{reference_docname}-{i}",
+				now,
+				now,
+				"Mpesa",
+				"Completed",
+				"POS Invoice",
+				reference_docname,
+				output,
+			)
+			for i in range(10)
+		],
+	)
+
+	return lambda: get_completed_integration_requests_info("POS Invoice", reference_docname, "checkout")
+
+
+@benchmark("webform_accept", number=20)
+def webform_accept(stack):
+	from payments.overrides.payment_webform import accept
+
+	web_form = frappe.get_doc(
+		{
+			"doctype": "Web Form",
+			"title": f"Benchmark {frappe.generate_hash(length=10)}",
+			"doc_type": "ToDo",
+			"module": "Payments",
+			"published": 1,
+			"web_form_fields": [
+				{"fieldname": "description", "fieldtype": "Text Editor", "label": "Description"}
+			],
+		}
+	).insert(ignore_permissions=True)
+	data = json.dumps({"doctype": "ToDo", "description": "Benchmark"})
+
+	return lambda: accept(web_form.name, data)
+
+
+@benchmark("payment_gateway_controller", number=2000)
+def payment_gateway_controller(stack):
+	from payments.utils import clear_payment_gateway_controller_cache, get_payment_gateway_controller
+
+	gateway = frappe.get_doc(
+		{
+			"doctype": "Payment Gateway",
+			"gateway": f"Benchmark {frappe.generate_hash(length=10)}",
+			"gateway_settings": "Razorpay Settings",
+			"gateway_controller": "Razorpay Settings",
+		}
+	).insert(ignore_permissions=True, ignore_links=True)
+	stack.callback(clear_payment_gateway_controller_cache)
+
+	return lambda: get_payment_gateway_controller(gateway.name)
+
+
+def measure(func, number, samples=SAMPLES):
+	"""Per-call latency percentiles over `samples` rounds of `number` calls, and peak allocations of one call"""
+	func()  # warm up caches
+
+	timings = []
+	for _ in range(samples):
+		started = time.perf_counter()
+		for _ in range(number):
+			func()
+		timings.append((time.perf_counter() - started) / number)
+	timings.sort()
+
+	tracemalloc.start()
+	try:
+		tracemalloc.reset_peak()
+		baseline, _peak = tracemalloc.get_traced_memory()
+		func()
+		_current, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+
+	return {
+		"p50_us": _percentile(timings, 50),
+		"p95_us": _percentile(timings, 95),
+		"p99_us": _percentile(timings, 99),
+		"alloc_peak_bytes": peak - baseline,
+	}
+
+
+def _percentile(sorted_timings, percent):
+	# nearest-rank percentile, in microseconds
+	rank = max(math.ceil(percent / 100 * len(sorted_timings)), 1)
+	return round(sorted_timings[rank - 1] * 1e6, 3)
+
+
+def run(only=None, samples=SAMPLES):
+	"""Run the benchmarks named in `only`, or all of them, and return their metrics by name"""
+	names = only or list(BENCHMARKS)
+	if unknown := set(names) - set(BENCHMARKS):
+		frappe.throw(frappe._("Unknown benchmarks: {0}").format(", ".join(sorted(unknown))))
+
+	results = {}
+	try:
+		for name in names:
+			with contextlib.ExitStack() as stack:
+				func = BENCHMARKS[name].setup(stack)
+				results[name] = measure(func, BENCHMARKS[name].number, samples)
+	finally:
+		frappe.db.rollback()
+
+	return results
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+	"""Return `(benchmark, metric, baseline, current)` for every tracked metric that grew beyond `threshold`"""
+	regressions = []
+	for name, metrics in results.items():
+		for metric in TRACKED_METRICS:
+			expected = (baseline.get(name) or {}).get(metric)
+			if expected is not None and metrics[metric] > expected * (1 + threshold):
+				regressions.append((name, metric, expected, metrics[metric]))
+
+	return regressions
@@ -0,0 +1,105 @@
+import csv
+import json
+import sys
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("issue-payment-codes")
+@click.argument("students_file", type=click.File("r"))
+@click.option("--amount", type=float, default=0, help="Amount of each paid code")
+@click.option("--free", is_flag=True, default=False, help="Issue free codes")
+@click.option("--disabled", is_flag=True, default=False, help="Issue the codes disabled")
+@click.option("--output", type=click.File("w"), help="CSV file for the issued codes, defaults to stdout")
+@pass_context
+def issue_payment_codes(context, students_file, amount, free, disabled, output):
+	"""Issue one Code Payment Gateways code per user id listed in STUDENTS_FILE"""
+	import frappe
+
+	from payments.payment_gateways.doctype.code_payment_gateways.code_payment_gateways import (
+		issue_codes,
+	)
+
+	students = [line.strip() for line in students_file if line.strip()]
+	site = get_site(context)
+
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		issued = issue_codes(students, code_amount=amount, free_code=int(free), enabled=int(not disabled))
+	finally:
+		frappe.destroy()
+
+	writer = csv.writer(output or sys.stdout)
+	writer.writerow(("student", "code"))
+	writer.writerows(issued)
+	click.secho(f"Issued {len(issued)} codes", fg="green", err=True)
+
+
+@click.command("export-integration-requests")
+@click.option("--service", help="Integration Request Service, e.g. Razorpay")
+@click.option("--from-date", help="Include requests created on or after this date")
+@click.option("--to-date", help="Include requests created before this date")
+@click.option("--status", help="Only export requests with this status")
+@click.option("--format", "export_format", type=click.Choice(["csv", "jsonl"]), default="csv")
+@click.option("--output", type=click.File("w", encoding="utf-8"), help="Output file, defaults to stdout")
+@pass_context
+def export_requests(context, service, from_date, to_date, status, export_format, output):
+	"""Stream Integration Requests as CSV or JSONL for reconciliation"""
+	import frappe
+
+	from payments.utils.export import export_integration_requests
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		export_integration_requests(
+			output or sys.stdout,
+			export_format,
+			service_name=service,
+			from_date=from_date,
+			to_date=to_date,
+			status=status,
+		)
+	finally:
+		frappe.destroy()
+
+
+@click.command("run-payments-benchmarks")
+@click.option("--only", multiple=True, help="Run only this benchmark, can be repeated")
+@click.option("--baseline", type=click.File("r"), help="Baseline JSON to check the results against")
+@click.option("--save-baseline", type=click.File("w"), help="Write the results as the new baseline")
+@click.option("--threshold", type=float, help="Allowed growth of tracked metrics, 0.25 is 25%")
+@pass_context
+def run_benchmarks(context, only, baseline, save_baseline, threshold):
+	"""Benchmark the hot payment paths, failing on regressions against a baseline"""
+	import frappe
+
+	from payments.benchmarks.suite import DEFAULT_THRESHOLD, find_regressions, run
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		results = run(only=list(only))
+	finally:
+		frappe.destroy()
+
+	for name, metrics in results.items():
+		click.echo(
+			f"{name:<45} p50 {metrics['p50_us']:>10.2f} µs  p95 {metrics['p95_us']:>10.2f} µs  "
+			f"p99 {metrics['p99_us']:>10.2f} µs  alloc {metrics['alloc_peak_bytes']:>8} B"
+		)
+
+	if save_baseline:
+		json.dump(results, save_baseline, indent=1, sort_keys=True)
+
+	if baseline:
+		regressions = find_regressions(results, json.load(baseline), threshold or DEFAULT_THRESHOLD)
+		for name, metric, expected, current in regressions:
+			click.secho(f"{name}: {metric} regressed from {expected} to {current}", fg="red", err=True)
+		if regressions:
+			sys.exit(1)
+
+
+commands = [issue_payment_codes, export_requests, run_benchmarks]
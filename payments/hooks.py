@@ -100,19 +100,40 @@ extend_doctype_class = {"Web Form": "payments.overrides.payment_webform.PaymentW
 # ---------------
 # Hook on document methods and events
 
-# doc_events = {
-# 	"*": {
-# 		"on_update": "method",
-# 		"on_cancel": "method",
-# 		"on_trash": "method"
-# 	}
-# }
+doc_events = {
+	"Payment Gateway": {
+		"on_update": "payments.utils.utils.clear_payment_gateway_controller_cache",
+		"after_rename": "payments.utils.utils.clear_payment_gateway_controller_cache",
+		"on_trash": "payments.utils.utils.clear_payment_gateway_controller_cache",
+	},
+	"Braintree Settings": {
+		"on_update": "payments.utils.utils.clear_checkout_context_cache",
+		"on_trash": "payments.utils.utils.clear_checkout_context_cache",
+	},
+	"GoCardless Settings": {
+		"on_update": "payments.utils.utils.clear_checkout_context_cache",
+		"on_trash": "payments.utils.utils.clear_checkout_context_cache",
+	},
+	"Razorpay Settings": {
+		"on_update": "payments.utils.utils.clear_checkout_context_cache",
+		"on_trash": "payments.utils.utils.clear_checkout_context_cache",
+	},
+	"Stripe Settings": {
+		"on_update": "payments.utils.utils.clear_checkout_context_cache",
+		"on_trash": "payments.utils.utils.clear_checkout_context_cache",
+	},
+	"User": {
+		"on_update": "payments.payment_gateways.doctype.code_payment_gateways.code_payment_gateways.clear_students_cache",
+		"after_rename": "payments.payment_gateways.doctype.code_payment_gateways.code_payment_gateways.clear_students_cache",
+		"on_trash": "payments.payment_gateways.doctype.code_payment_gateways.code_payment_gateways.clear_students_cache",
+	},
+}
 
 # Scheduled Tasks
 # ---------------
 
 scheduler_events = {
-	"all": [
+	"hourly": [
 		"payments.payment_gateways.doctype.razorpay_settings.razorpay_settings.capture_payment",
 	],
 }
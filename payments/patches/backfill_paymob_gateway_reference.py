@@ -0,0 +1,30 @@
+import json
+
+import frappe
+
+from payments.utils import make_integration_request_fields
+
+
+def execute():
+	make_integration_request_fields()
+
+	requests = frappe.get_all(
+		"Integration Request",
+		filters={"integration_request_service": "Paymob", "gateway_reference": ("is", "not set")},
+		fields=["name", "data"],
+	)
+
+	for request in requests:
+		try:
+			paymob_order_id = json.loads(request.data or "{}").get("paymob_order_id")
+		except ValueError:
+			continue
+
+		if paymob_order_id:
+			frappe.db.set_value(
+				"Integration Request",
+				request.name,
+				"gateway_reference",
+				str(paymob_order_id),
+				update_modified=False,
+			)
@@ -0,0 +1,36 @@
+from collections import defaultdict
+
+import frappe
+
+from payments.payment_gateways.doctype.code_payment_gateways.code_payment_gateways import normalize_code
+
+
+def execute():
+	# codes are looked up in upper case, compared case-sensitively on some databases
+	codes = defaultdict(list)
+	for doc in frappe.get_all("Code Payment Gateways", fields=["name", "code"]):
+		codes[normalize_code(doc.code)].append(doc)
+
+	table = frappe.qb.DocType("Code Payment Gateways")
+	collisions = []
+	for code, docs in codes.items():
+		if not code:
+			continue
+
+		if len(docs) > 1:
+			# normalizing would break the unique index, these are left for an administrator to merge
+			collisions.extend(doc.name for doc in docs)
+			continue
+
+		doc = docs[0]
+		if doc.name != code or doc.code != code:
+			# named by `code`, and no other doctype links to codes, so the name is updated in place
+			frappe.qb.update(table).set(table.name, code).set(table.code, code).where(
+				table.name == doc.name
+			).run()
+
+	if collisions:
+		print(
+			"Code Payment Gateways left unnormalized, their codes differ only in case or whitespace: "
+			+ ", ".join(sorted(collisions))
+		)
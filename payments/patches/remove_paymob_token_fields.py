@@ -0,0 +1,8 @@
+import frappe
+from frappe.utils.password import remove_encrypted_password
+
+
+def execute():
+	# the auth token lives in the cache, the fields that used to hold it are gone
+	frappe.db.delete("Singles", {"doctype": "Paymob Settings", "field": ("in", ("token", "expires_in"))})
+	remove_encrypted_password("Paymob Settings", "Paymob Settings", "token")
@@ -1,13 +1,34 @@
 # Copyright (c) 2025, Frappe Technologies and contributors
 # For license information, please see license.txt
 
+import secrets
+
 import frappe
 from frappe import _
 from frappe.integrations.utils import create_request_log
 from frappe.model.document import Document
-from frappe.utils import call_hook_method, get_url
+from frappe.query_builder.functions import Coalesce
+from frappe.utils import call_hook_method, cint, flt, get_url, now
+
+from payments.utils import (
+    clear_payment_gateway_controller_cache,
+    create_payment_gateway,
+    get_affected_rows,
+)
+
+REDEEMABLE_CODES_KEY = "redeemable_payment_codes"
+ENABLED_CODES_KEY = "code_payment_gateways_enabled"
+
+# unambiguous characters only, codes get typed in by students
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 10
+ISSUE_BATCH_SIZE = 5000
+
+STUDENT_ROLE = "LMS Student"
+STUDENTS_FIRST_PAGE_KEY = "code_payment_gateways_students"
+STUDENTS_CACHE_TTL = 5 * 60
 
-from payments.utils import create_payment_gateway
+_CODE_TRANSLATION = bytes(ord(CODE_ALPHABET[i % len(CODE_ALPHABET)]) for i in range(256))
 
 
 class CodePaymentGateways(Document):
@@ -16,12 +37,15 @@ class CodePaymentGateways(Document):
 
     def before_insert(self):
         """Initialize remaining amount before inserting"""
+        # normalize before naming, codes are named and looked up in upper case
+        self.code = normalize_code(self.code)
         if not self.free_code and self.code_amount:
             self.code_remaining_amount = self.code_amount
             self.code_used_amount = 0
 
     def validate(self):
         """Validate and set remaining amount"""
+        self.code = normalize_code(self.code)
         if not self.free_code and self.code_amount:
             if self.is_new():
                 self.code_remaining_amount = self.code_amount
@@ -45,6 +69,21 @@ class CodePaymentGateways(Document):
             call_hook_method("payment_gateway_enabled",
                              gateway="Manual Payment")
 
+        # the Manual Payment controller is the latest enabled record
+        clear_payment_gateway_controller_cache()
+        self.clear_code_cache()
+
+    def on_trash(self):
+        clear_payment_gateway_controller_cache()
+        self.clear_code_cache()
+
+    def clear_code_cache(self):
+        students = {self.student}
+        if previous := self.get_doc_before_save():
+            students.add(previous.student)
+
+        clear_code_cache(*students)
+
     def validate_transaction_currency(self, currency):
         """Validate if currency is supported"""
         if currency not in self.supported_currencies:
@@ -80,46 +119,264 @@ class CodePaymentGateways(Document):
         return url
 
 
+def redeem_code(code_name, amount):
+    """Deduct `amount` from a paid code with a single conditional UPDATE.
+
+    The balance check is part of the UPDATE, so concurrent redemptions can never
+    overdraw a code. Returns the new remaining amount, or None if the code is
+    disabled or its balance is insufficient. The caller commits.
+    """
+    code_name = normalize_code(code_name)
+    table = frappe.qb.DocType("Code Payment Gateways")
+    (
+        frappe.qb.update(table)
+        .set(table.code_remaining_amount, table.code_remaining_amount - amount)
+        .set(table.code_used_amount, Coalesce(table.code_used_amount, 0) + amount)
+        .set(table.modified, now())
+        .where(table.name == code_name)
+        .where(table.enabled == 1)
+        .where(table.free_code == 0)
+        .where(table.code_remaining_amount > 0)
+        .where(table.code_remaining_amount >= amount)
+    ).run()
+
+    if not get_affected_rows():
+        return None
+
+    frappe.clear_document_cache("Code Payment Gateways", code_name)
+    # the row is locked by the UPDATE until commit, so this is the balance we left
+    remaining_amount, student = frappe.db.get_value(
+        "Code Payment Gateways", code_name, ["code_remaining_amount", "student"]
+    )
+    clear_code_cache(student)
+
+    return flt(remaining_amount)
+
+
+def normalize_code(code):
+    return (code or "").strip().upper() or None
+
+
+def has_enabled_codes():
+    """Return True if any code is enabled, cached until a code changes"""
+    return frappe.cache().get_value(
+        ENABLED_CODES_KEY,
+        lambda: bool(frappe.db.exists("Code Payment Gateways", {"enabled": 1})),
+    )
+
+
+def get_redeemable_codes(user):
+    """Return the enabled codes of `user` that are free or have a remaining balance.
+
+    Cached per user until one of their codes is updated, deleted or redeemed.
+    """
+
+    def _get_redeemable_codes():
+        codes = frappe.get_all(
+            "Code Payment Gateways",
+            filters={"student": user, "enabled": 1},
+            fields=["code", "free_code", "code_amount", "code_remaining_amount"],
+            order_by="creation desc",
+        )
+
+        return [
+            {
+                "code": code.code,
+                "amount": code.code_amount if not code.free_code else 0,
+                "free_code": code.free_code,
+                "remaining_amount": code.code_remaining_amount if not code.free_code else None,
+            }
+            for code in codes
+            if code.free_code or flt(code.code_remaining_amount) > 0
+        ]
+
+    return frappe.cache().hget(REDEEMABLE_CODES_KEY, user, _get_redeemable_codes)
+
+
+def clear_code_cache(*students):
+    for student in students:
+        if student:
+            frappe.cache().hdel(REDEEMABLE_CODES_KEY, student)
+    frappe.cache().delete_value(ENABLED_CODES_KEY)
+
+
+def clear_all_code_caches():
+    """Drop the redeemable codes of every student at once, for changes to many students"""
+    frappe.cache().delete_value([REDEEMABLE_CODES_KEY, ENABLED_CODES_KEY])
+
+
+def generate_codes(count, length=CODE_LENGTH):
+    """Return `count` distinct random codes"""
+    codes = set()
+    while len(codes) < count:
+        # 32 characters divide 256 evenly, so mapping random bytes keeps codes uniform
+        missing = count - len(codes)
+        chars = secrets.token_bytes(missing * length).translate(_CODE_TRANSLATION).decode()
+        codes.update(chars[i:i + length] for i in range(0, len(chars), length))
+    return list(codes)
+
+
+def issue_codes(students, code_amount=0, free_code=0, enabled=1, length=CODE_LENGTH):
+    """Issue one code per entry in `students` with multi-row inserts.
+
+    All students are validated before the first batch is inserted, and no code is looked
+    up before it is inserted: the unique index on `code` rejects the rare collision with
+    an existing code, in which case only that batch is regenerated. Returns a list of
+    `(student, code)` tuples.
+    """
+    free_code = int(cint(free_code))
+    code_amount = 0 if free_code else flt(code_amount)
+    if not free_code and code_amount <= 0:
+        frappe.throw(_("Code Amount must be greater than zero for paid codes"))
+
+    fields = (
+        "name", "code", "student", "enabled", "free_code", "code_amount",
+        "code_used_amount", "code_remaining_amount",
+        "creation", "modified", "owner", "modified_by", "docstatus",
+    )
+    # batches are committed as they go, so no batch may go in before every student is known
+    validate_students(students)
+    issued = []
+
+    for start in range(0, len(students), ISSUE_BATCH_SIZE):
+        batch = students[start:start + ISSUE_BATCH_SIZE]
+
+        now_datetime = now()
+        user = frappe.session.user
+        for attempt in range(3):
+            codes = generate_codes(len(batch), length)
+            values = [
+                (
+                    code, code, student, int(cint(enabled)), free_code, code_amount,
+                    0, code_amount, now_datetime, now_datetime, user, user, 0,
+                )
+                for student, code in zip(batch, codes, strict=True)
+            ]
+
+            frappe.db.savepoint("issue_codes")
+            try:
+                frappe.db.bulk_insert("Code Payment Gateways", fields, values)
+            except Exception as e:
+                if attempt == 2 or not frappe.db.is_unique_key_violation(e):
+                    raise
+                frappe.db.rollback(save_point="issue_codes")
+                continue
+
+            break
+
+        frappe.db.commit()
+        issued.extend(zip(batch, codes, strict=True))
+
+    clear_all_code_caches()
+    if cint(enabled):
+        # the bulk insert skips on_update, announce the gateway once for the whole run
+        create_payment_gateway("Manual Payment")
+        call_hook_method("payment_gateway_enabled", gateway="Manual Payment")
+        clear_payment_gateway_controller_cache()
+
+    return issued
+
+
+def validate_students(students):
+    """Throw if any of `students` is not an enabled user with the student role,
+    with one query per batch of users"""
+    user = frappe.qb.DocType("User")
+    has_role = frappe.qb.DocType("Has Role")
+
+    students = sorted(set(students))
+    valid_students = set()
+    for start in range(0, len(students), ISSUE_BATCH_SIZE):
+        valid_students.update(
+            frappe.qb.from_(user)
+            .join(has_role)
+            .on((has_role.parent == user.name) & (has_role.parenttype == "User"))
+            .select(user.name)
+            .where(user.name.isin(students[start:start + ISSUE_BATCH_SIZE]))
+            .where(user.enabled == 1)
+            .where(has_role.role == STUDENT_ROLE)
+            .run(pluck=True)
+        )
+
+    if invalid_students := sorted(set(students) - valid_students):
+        frappe.throw(
+            _("Students not found, disabled or without the {0} role: {1}").format(
+                STUDENT_ROLE, ", ".join(invalid_students[:20]))
+        )
+
+
+@frappe.whitelist()
+def bulk_issue_codes(students, code_amount=0, free_code=0, enabled=1):
+    """Issue one code per student, `students` is a list or newline separated user ids"""
+    frappe.has_permission("Code Payment Gateways", "create", throw=True)
+
+    if isinstance(students, str):
+        students = frappe.parse_json(students) if students.startswith("[") else students.splitlines()
+
+    students = [student.strip() for student in students if student and student.strip()]
+    return [
+        {"student": student, "code": code}
+        for student, code in issue_codes(students, code_amount, free_code, enabled)
+    ]
+
+
+def on_doctype_update():
+    frappe.db.add_index("Code Payment Gateways", ["student", "enabled"])
+
+
 @frappe.whitelist()
 @frappe.validate_and_sanitize_search_inputs
 def get_students(doctype, txt, searchfield, start, page_len, filters):
     """Filter User link field to show only users with 'LMS Student' role
 
-    Pattern based on frappe/core/doctype/role/role.py:get_users()
-    and frappe/core/doctype/user/user.py:user_query()
+    Runs as one User / Has Role join with prefix matches, which the name index
+    serves, instead of collecting every student into an IN clause. The first page
+    of an empty search is what every form opens with, so it is cached briefly and
+    dropped whenever a user changes.
     """
-    # Get user names that have 'LMS Student' role (from Has Role child table)
-    student_users = frappe.get_all(
-        "Has Role",
-        filters={"role": "LMS Student", "parenttype": "User"},
-        fields=["parent"],
-        pluck="parent"
-    )
+    frappe.has_permission("Code Payment Gateways", "write", throw=True)
 
-    if not student_users:
-        return []
-
-    # Build filters for User query
-    list_filters = {
-        "enabled": 1,
-        "docstatus": ["<", 2],
-        "name": ["in", student_users]
-    }
-
-    # Build search filters
-    or_filters = [[searchfield, "like", f"%{txt}%"]]
-    if "name" in searchfield:
-        or_filters += [[field, "like", f"%{txt}%"]
-                       for field in ("first_name", "middle_name", "last_name")]
-
-    # Get users matching the filters
-    return frappe.get_list(
-        "User",
-        filters=list_filters,
-        fields=["name", "full_name"],
-        limit_start=start,
-        limit_page_length=page_len,
-        order_by="name asc",
-        or_filters=or_filters,
-        as_list=True,
+    start, page_len = cint(start), cint(page_len)
+    if not txt and not start:
+        cache_key = f"{STUDENTS_FIRST_PAGE_KEY}|{page_len}"
+        if (students := frappe.cache().get_value(cache_key)) is None:
+            students = _get_students(txt, start, page_len)
+            frappe.cache().set_value(cache_key, students, expires_in_sec=STUDENTS_CACHE_TTL)
+        return students
+
+    return _get_students(txt, start, page_len)
+
+
+def clear_students_cache(doc=None, method=None):
+    """Drop the cached first pages of students, on every change to a User or their roles"""
+    frappe.cache().delete_keys(STUDENTS_FIRST_PAGE_KEY)
+
+
+def _get_students(txt, start, page_len):
+    user = frappe.qb.DocType("User")
+    has_role = frappe.qb.DocType("Has Role")
+
+    query = (
+        frappe.qb.from_(user)
+        .join(has_role)
+        .on((has_role.parent == user.name) & (has_role.parenttype == "User"))
+        .select(user.name, user.full_name)
+        .where(has_role.role == STUDENT_ROLE)
+        .where(user.enabled == 1)
+        .where(user.docstatus < 2)
+        .distinct()
+        .orderby(user.name)
+        .limit(page_len)
+        .offset(start)
     )
+
+    if txt:
+        prefix = f"{txt}%"
+        query = query.where(
+            user.name.like(prefix)
+            | user.first_name.like(prefix)
+            | user.middle_name.like(prefix)
+            | user.last_name.like(prefix)
+            | user.full_name.like(prefix)
+        )
+
+    return query.run()
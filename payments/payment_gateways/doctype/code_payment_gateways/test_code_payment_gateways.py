@@ -1,9 +1,270 @@
 # Copyright (c) 2025, Frappe Technologies and Contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
+from frappe.integrations.utils import create_request_log
 from frappe.tests.utils import FrappeTestCase
 
+from payments.patches import normalize_payment_codes
+from payments.payment_gateways.doctype.code_payment_gateways import code_payment_gateways
+from payments.payment_gateways.doctype.code_payment_gateways.code_payment_gateways import (
+	STUDENT_ROLE,
+	generate_codes,
+	get_students,
+	issue_codes,
+	normalize_code,
+	redeem_code,
+)
+from payments.templates.pages.manual_payment import confirm_manual_payment
+
+STUDENT = "code-payment-student@example.com"
+OTHER_STUDENT = "code-payment-student-2@example.com"
+NOT_A_STUDENT = "code-payment-user@example.com"
+NEW_STUDENT = "code-payment-student-3@example.com"
+
 
 class TestCodePaymentGateways(FrappeTestCase):
-	pass
+	# confirm_manual_payment commits and rolls back itself, so records are committed and removed by hand
+	def setUp(self):
+		if not frappe.db.exists("Role", STUDENT_ROLE):
+			frappe.get_doc({"doctype": "Role", "role_name": STUDENT_ROLE}).insert(ignore_permissions=True)
+
+		make_user(STUDENT, STUDENT_ROLE)
+		make_user(OTHER_STUDENT, STUDENT_ROLE)
+		make_user(NOT_A_STUDENT)
+		frappe.db.commit()
+
+		self.codes, self.integration_requests = [], []
+
+	def tearDown(self):
+		frappe.set_user("Administrator")
+		frappe.db.rollback()
+		for name in self.codes:
+			frappe.delete_doc("Code Payment Gateways", name, force=True, ignore_permissions=True)
+		# issued codes are committed batch by batch
+		frappe.db.delete(
+			"Code Payment Gateways", {"student": ("in", (STUDENT, OTHER_STUDENT, NOT_A_STUDENT))}
+		)
+		frappe.db.delete("Integration Request", {"name": ("in", self.integration_requests)})
+		frappe.db.commit()
+
+	def make_code(self, code_amount=0, free_code=0):
+		doc = frappe.get_doc(
+			{
+				"doctype": "Code Payment Gateways",
+				"code": generate_codes(1)[0],
+				"student": STUDENT,
+				"enabled": 1,
+				"free_code": free_code,
+				"code_amount": code_amount,
+			}
+		).insert(ignore_permissions=True)
+		self.codes.append(doc.name)
+		return doc
+
+	def make_payment(self, amount):
+		integration_request = create_request_log(
+			{"amount": amount, "currency": "USD"}, service_name="Manual Payment"
+		)
+		self.integration_requests.append(integration_request.name)
+		return integration_request.name
+
+	def confirm(self, token, code):
+		frappe.db.commit()
+		frappe.set_user(STUDENT)
+		try:
+			return confirm_manual_payment(token, code)
+		finally:
+			frappe.set_user("Administrator")
+
+	def assertRemaining(self, code, remaining_amount, used_amount):
+		self.assertEqual(
+			frappe.db.get_value(
+				"Code Payment Gateways", code.name, ["code_remaining_amount", "code_used_amount"]
+			),
+			(remaining_amount, used_amount),
+		)
+
+	def test_redeem_paid_code(self):
+		code = self.make_code(code_amount=100)
+		token = self.make_payment(60)
+
+		result = self.confirm(token, code.code.lower())
+
+		self.assertTrue(result["success"], result)
+		self.assertRemaining(code, 40, 60)
+		self.assertEqual(frappe.db.get_value("Integration Request", token, "status"), "Completed")
+
+	def test_overdraw_is_rejected(self):
+		code = self.make_code(code_amount=100)
+		self.assertTrue(self.confirm(self.make_payment(60), code.code)["success"])
+
+		token = self.make_payment(60)
+		result = self.confirm(token, code.code)
+
+		self.assertFalse(result["success"])
+		self.assertIn("exceeds code remaining limit", result["message"])
+		self.assertRemaining(code, 40, 60)
+		# the integration request marked Completed before the redemption is rolled back with it
+		self.assertNotEqual(frappe.db.get_value("Integration Request", token, "status"), "Completed")
+
+	def test_double_confirmation_redeems_once(self):
+		code = self.make_code(code_amount=100)
+		token = self.make_payment(30)
+		self.assertTrue(self.confirm(token, code.code)["success"])
+
+		# a concurrent confirmation read the request before the first one completed it
+		get_value = frappe.db.get_value
+
+		def stale_get_value(doctype, *args, **kwargs):
+			value = get_value(doctype, *args, **kwargs)
+			if doctype == "Integration Request":
+				value.status = "Queued"
+			return value
+
+		with patch.object(frappe.db, "get_value", stale_get_value):
+			result = self.confirm(token, code.code)
+
+		self.assertFalse(result["success"])
+		self.assertEqual(result["message"], "This payment has already been confirmed")
+		self.assertRemaining(code, 70, 30)
+
+	def test_free_code(self):
+		code = self.make_code(free_code=1)
+		token = self.make_payment(500)
+
+		result = self.confirm(token, code.code)
+
+		self.assertTrue(result["success"], result)
+		self.assertRemaining(code, 0, 0)
+		self.assertEqual(frappe.db.get_value("Integration Request", token, "status"), "Completed")
+
+	def test_issue_codes(self):
+		students = [STUDENT, OTHER_STUDENT, STUDENT]
+
+		with patch.object(code_payment_gateways, "call_hook_method") as call_hook_method:
+			issued = issue_codes(students, code_amount=100)
+
+		self.assertEqual([student for student, _code in issued], students)
+		codes = [code for _student, code in issued]
+		self.assertEqual(len(set(codes)), len(codes))
+		self.assertEqual(
+			frappe.get_all(
+				"Code Payment Gateways",
+				filters={"name": ("in", codes)},
+				fields=["student", "code_remaining_amount"],
+				order_by="student",
+			),
+			[
+				{"student": OTHER_STUDENT, "code_remaining_amount": 100},
+				{"student": STUDENT, "code_remaining_amount": 100},
+				{"student": STUDENT, "code_remaining_amount": 100},
+			],
+		)
+		# the hook fires once per run, not once per code
+		call_hook_method.assert_called_once_with("payment_gateway_enabled", gateway="Manual Payment")
+
+	def test_issue_codes_retries_collisions(self):
+		existing = self.make_code(code_amount=100).code
+		generated = iter([[existing, "RETRYCODE2"], ["RETRYCODE1", "RETRYCODE2"]])
+
+		with patch.object(code_payment_gateways, "generate_codes", lambda count, length: next(generated)):
+			issued = issue_codes([STUDENT, OTHER_STUDENT], code_amount=100)
+
+		self.assertEqual(issued, [(STUDENT, "RETRYCODE1"), (OTHER_STUDENT, "RETRYCODE2")])
+		self.assertEqual(frappe.db.get_value("Code Payment Gateways", existing, "code_remaining_amount"), 100)
+		self.assertEqual(frappe.db.count("Code Payment Gateways", {"student": OTHER_STUDENT}), 1)
+
+	def test_issue_codes_rejects_invalid_students(self):
+		for student in (NOT_A_STUDENT, "code-payment-missing@example.com"):
+			with self.subTest(student), self.assertRaises(frappe.ValidationError):
+				issue_codes([STUDENT, student], code_amount=100)
+
+		frappe.db.rollback()
+		self.assertFalse(frappe.db.exists("Code Payment Gateways", {"student": STUDENT}))
+
+	def test_normalize_code(self):
+		for code, normalized in (
+			(" abcd2345\n", "ABCD2345"),
+			("ABCD2345", "ABCD2345"),
+			(" ", None),
+			(None, None),
+		):
+			with self.subTest(code):
+				self.assertEqual(normalize_code(code), normalized)
+
+	def test_redeem_mixed_case_code(self):
+		code = self.make_code(code_amount=100)
+
+		self.assertEqual(redeem_code(f" {code.name.lower()} ", 30), 70)
+		self.assertRemaining(code, 70, 30)
+
+	def test_normalize_patch(self):
+		lower_case = self.make_code(code_amount=100)
+		self.rename_code(lower_case.name, lower_case.code.lower())
+
+		# differs from another code only in case and whitespace
+		original, duplicate = self.make_code(code_amount=100), self.make_code(code_amount=100)
+		self.rename_code(duplicate.name, f" {original.code.lower()}")
+		self.codes.append(f" {original.code.lower()}")
+
+		normalize_payment_codes.execute()
+
+		self.assertEqual(
+			frappe.db.get_value("Code Payment Gateways", lower_case.code, ["name", "code"]),
+			(lower_case.code, lower_case.code),
+		)
+		self.assertEqual(
+			frappe.get_all(
+				"Code Payment Gateways",
+				filters={"name": ("in", (original.name, f" {original.code.lower()}"))},
+				pluck="code",
+				order_by="name",
+			),
+			[f" {original.code.lower()}", original.code],
+		)
+
+	def search_students(self, txt="", page_len=10000):
+		return [name for name, _full_name in get_students("User", txt, "name", 0, page_len, {})]
+
+	def test_get_students_permission(self):
+		frappe.set_user(STUDENT)
+
+		with self.assertRaises(frappe.PermissionError):
+			self.search_students()
+
+	def test_get_students_prefix_match(self):
+		self.assertCountEqual(self.search_students("code-payment-student"), [STUDENT, OTHER_STUDENT])
+		# matches start at the beginning of a name only
+		self.assertEqual(self.search_students("payment-student"), [])
+		self.assertEqual(self.search_students("code-payment-user"), [])
+
+	def test_get_students_cache(self):
+		if frappe.db.exists("User", NEW_STUDENT):
+			frappe.delete_doc("User", NEW_STUDENT, force=True, ignore_permissions=True)
+
+		self.assertNotIn(NEW_STUDENT, self.search_students())
+		make_user(NEW_STUDENT, STUDENT_ROLE)
+
+		self.assertIn(NEW_STUDENT, self.search_students())
+
+	def rename_code(self, name, code):
+		table = frappe.qb.DocType("Code Payment Gateways")
+		frappe.qb.update(table).set(table.name, code).set(table.code, code).where(table.name == name).run()
+
+
+def make_user(email, *roles):
+	if not frappe.db.exists("User", email):
+		frappe.get_doc(
+			{
+				"doctype": "User",
+				"email": email,
+				"first_name": "Code Payment User",
+				"send_welcome_email": 0,
+			}
+		).insert(ignore_permissions=True)
+
+	if roles:
+		frappe.get_doc("User", email).add_roles(*roles)
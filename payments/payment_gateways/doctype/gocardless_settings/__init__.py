@@ -8,6 +8,8 @@ import json
 
 import frappe
 
+from payments.utils import record_webhook_events, set_webhook_event_status
+
 
 @frappe.whitelist(allow_guest=True)
 def webhooks():
@@ -19,12 +21,38 @@ def webhooks():
 		raise frappe.AuthenticationError
 
 	gocardless_events = json.loads(r.get_data()) or []
-	for event in gocardless_events["events"]:
-		set_status(event)
+	# events and mandate updates are committed together, a failed update leaves no
+	# trace of the events so that GoCardless' redelivery applies them
+	new_events = record_webhook_events(
+		"GoCardless", [(event.get("id"), event) for event in gocardless_events["events"]]
+	)
+
+	set_mandate_statuses(get_final_mandate_statuses(new_events.values()))
+	set_webhook_event_status(list(new_events), "Completed")
+	frappe.db.commit()
 
 	return 200
 
 
+def get_final_mandate_statuses(events):
+	"""Collapse a batch of events into the last `disabled` state of each mandate.
+
+	Events redelivered within the batch are only applied once, and later events
+	win over earlier ones regardless of the order they were sent in.
+	"""
+	unique_events = {}
+	for event in events:
+		unique_events.setdefault(event.get("id") or len(unique_events), event)
+
+	statuses = {}
+	for event in sorted(unique_events.values(), key=lambda event: event.get("created_at") or ""):
+		if event.get("resource_type", {}) == "mandates":
+			mandates, disabled = get_mandate_status(event)
+			statuses.update(dict.fromkeys(mandates, disabled))
+
+	return statuses
+
+
 def set_status(event):
 	resource_type = event.get("resource_type", {})
 
@@ -33,6 +61,11 @@ def set_status(event):
 
 
 def set_mandate_status(event):
+	mandates, disabled = get_mandate_status(event)
+	set_mandate_statuses(dict.fromkeys(mandates, disabled))
+
+
+def get_mandate_status(event):
 	mandates = []
 	if isinstance(event["links"], list):
 		for link in event["links"]:
@@ -50,8 +83,15 @@ def set_mandate_status(event):
 	else:
 		disabled = 1
 
-	for mandate in mandates:
-		frappe.db.set_value("GoCardless Mandate", mandate, "disabled", disabled)
+	return mandates, disabled
+
+
+def set_mandate_statuses(statuses):
+	"""Update `disabled` on GoCardless Mandates with one query per state"""
+	for disabled in (0, 1):
+		mandates = [mandate for mandate, state in statuses.items() if state == disabled]
+		if mandates:
+			frappe.db.set_value("GoCardless Mandate", {"name": ("in", mandates)}, "disabled", disabled)
 
 
 def authenticate_signature(r):
@@ -200,8 +200,8 @@ class GoCardlessSettings(Document):
 
 
 def get_gateway_controller(doc):
-	payment_request = frappe.get_doc("Payment Request", doc)
-	return frappe.db.get_value("Payment Gateway", payment_request.payment_gateway, "gateway_controller")
+	payment_gateway = frappe.db.get_value("Payment Request", doc, "payment_gateway")
+	return frappe.get_cached_value("Payment Gateway", payment_gateway, "gateway_controller")
 
 
 def gocardless_initialization(doc):
@@ -3,6 +3,38 @@
 
 import unittest
 
+from payments.payment_gateways.doctype.gocardless_settings import get_final_mandate_statuses
+
+
+def make_event(event_id, created_at, action, links):
+	return {
+		"id": event_id,
+		"created_at": created_at,
+		"resource_type": "mandates",
+		"action": action,
+		"links": links,
+	}
+
 
 class TestGoCardlessSettings(unittest.TestCase):
-	pass
+	def test_final_mandate_statuses(self):
+		events = [
+			# sent out of order, the cancellation is the latest event of MD1
+			make_event("EV3", "2024-01-01T10:02:00.000Z", "cancelled", {"mandate": "MD1"}),
+			make_event("EV1", "2024-01-01T10:00:00.000Z", "active", [{"mandate": "MD1"}, {"mandate": "MD2"}]),
+			make_event("EV2", "2024-01-01T10:01:00.000Z", "failed", {"mandate": "MD2"}),
+			# redelivery of EV1 must not re-activate either mandate
+			make_event("EV1", "2024-01-01T10:00:00.000Z", "active", [{"mandate": "MD1"}, {"mandate": "MD2"}]),
+			make_event("EV4", "2024-01-01T10:03:00.000Z", "submitted", [{"mandate": "MD3"}]),
+			{"id": "EV5", "created_at": "2024-01-01T10:04:00.000Z", "resource_type": "payments"},
+		]
+
+		self.assertEqual(get_final_mandate_statuses(events), {"MD1": 1, "MD2": 1, "MD3": 0})
+
+	def test_later_event_wins(self):
+		events = [
+			make_event("EV2", "2024-01-01T10:01:00.000Z", "active", {"mandate": "MD1"}),
+			make_event("EV1", "2024-01-01T10:00:00.000Z", "cancelled", [{"mandate": "MD1"}]),
+		]
+
+		self.assertEqual(get_final_mandate_statuses(events), {"MD1": 0})
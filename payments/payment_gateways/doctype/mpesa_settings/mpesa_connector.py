@@ -1,9 +1,11 @@
 import base64
 import datetime
+import hashlib
 
-import requests
 from requests.auth import HTTPBasicAuth
 
+from payments.utils import get_cached_token, get_session
+
 
 class MpesaConnector:
 	def __init__(
@@ -14,7 +16,7 @@ class MpesaConnector:
 		sandbox_url="https://sandbox.safaricom.co.ke",
 		live_url="https://api.safaricom.co.ke",
 	):
-		"""Setup configuration for Mpesa connector and generate new access token."""
+		"""Setup configuration for Mpesa connector and fetch an access token."""
 		self.env = env
 		self.app_key = app_key
 		self.app_secret = app_secret
@@ -22,20 +24,37 @@ class MpesaConnector:
 			self.base_url = sandbox_url
 		else:
 			self.base_url = live_url
+		self.session = get_session(self.base_url)
 		self.authenticate()
 
 	def authenticate(self):
 		"""
 		This method is used to fetch the access token required by Mpesa.
 
+		Tokens are cached per app key and environment and shared by all workers,
+		so a new one is only generated shortly before the current one expires.
+
 		Returns:
 		        access_token (str): This token is to be used with the Bearer header for further API calls to Mpesa.
 		"""
+		credentials = f"{self.env}:{self.app_key}:{self.app_secret}".encode()
+		cache_key = f"mpesa_access_token|{hashlib.sha256(credentials).hexdigest()}"
+
+		self.authentication_token = get_cached_token(cache_key, self.generate_access_token)
+		return self.authentication_token
+
+	def generate_access_token(self):
+		"""
+		Generate a new access token from Mpesa's OAuth API.
+
+		Returns:
+		        tuple: The access token and its lifetime in seconds.
+		"""
 		authenticate_uri = "/oauth/v1/generate?grant_type=client_credentials"
 		authenticate_url = f"{self.base_url}{authenticate_uri}"
-		r = requests.get(authenticate_url, auth=HTTPBasicAuth(self.app_key, self.app_secret))
-		self.authentication_token = r.json()["access_token"]
-		return r.json()["access_token"]
+		r = self.session.get(authenticate_url, auth=HTTPBasicAuth(self.app_key, self.app_secret))
+		response = r.json()
+		return response["access_token"], int(response.get("expires_in") or 3599)
 
 	def get_balance(
 		self,
@@ -81,7 +100,7 @@ class MpesaConnector:
 			"Content-Type": "application/json",
 		}
 		saf_url = "{}{}".format(self.base_url, "/mpesa/accountbalance/v1/query")
-		r = requests.post(saf_url, headers=headers, json=payload)
+		r = self.session.post(saf_url, headers=headers, json=payload)
 		return r.json()
 
 	def stk_push(
@@ -141,5 +160,5 @@ class MpesaConnector:
 		}
 
 		saf_url = "{}{}".format(self.base_url, "/mpesa/stkpush/v1/processrequest")
-		r = requests.post(saf_url, headers=headers, json=payload)
+		r = self.session.post(saf_url, headers=headers, json=payload)
 		return r.json()
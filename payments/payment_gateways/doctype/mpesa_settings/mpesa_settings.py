@@ -8,13 +8,15 @@ import frappe
 from frappe import _
 from frappe.integrations.utils import create_request_log
 from frappe.model.document import Document
-from frappe.utils import call_hook_method, fmt_money, get_request_site_address
+from frappe.utils import call_hook_method, cint, fmt_money, get_request_site_address
 
 from payments.payment_gateways.doctype.mpesa_settings.mpesa_connector import MpesaConnector
 from payments.payment_gateways.doctype.mpesa_settings.mpesa_custom_fields import (
     create_custom_pos_fields,
 )
-from payments.utils import erpnext_app_import_guard
+from payments.utils import bulk_create_request_logs, erpnext_app_import_guard, map_concurrently
+
+STK_PUSH_WORKERS = 4
 
 
 class MpesaSettings(Document):
@@ -49,23 +51,38 @@ class MpesaSettings(Document):
         frappe.db.commit()  # nosemgrep
 
     def request_for_payment(self, **kwargs):
+        """Send one STK push per split amount; the pushes are dispatched concurrently."""
         args = frappe._dict(kwargs)
         request_amounts = self.split_request_amount_according_to_transaction_limit(
             args)
 
-        for _i, amount in enumerate(request_amounts):
-            args.request_amount = amount
-            if frappe.flags.in_test:
-                from payments.payment_gateways.doctype.mpesa_settings.test_mpesa_settings import (
-                    get_payment_request_response_payload,
-                )
+        if frappe.flags.in_test:
+            from payments.payment_gateways.doctype.mpesa_settings.test_mpesa_settings import (
+                get_payment_request_response_payload,
+            )
 
-                response = frappe._dict(
-                    get_payment_request_response_payload(amount))
-            else:
-                response = frappe._dict(generate_stk_push(**args))
+            results = [(get_payment_request_response_payload(amount), None)
+                       for amount in request_amounts]
+        else:
+            results = generate_stk_pushes(request_amounts, **args)
+
+        request_dicts, responses, errors = [], [], []
+        for amount, (response, error) in zip(request_amounts, results, strict=True):
+            if error:
+                frappe.log_error(
+                    f"[mpesa_settings.py] request_for_payment: {error!s}")
+                errors.append(
+                    _("Issue detected with Mpesa configuration, check the error logs for more details"))
+                continue
+
+            request_dicts.append(frappe._dict(args, request_amount=amount))
+            responses.append(frappe._dict(response))
 
-            self.handle_api_response("CheckoutRequestID", args, response)
+        errors += self.handle_api_responses(
+            "CheckoutRequestID", request_dicts, responses)
+
+        if errors:
+            frappe.throw("<br>".join(errors), title=_("Transaction Error"))
 
     def split_request_amount_according_to_transaction_limit(self, args):
         request_amount = args.request_amount
@@ -122,48 +139,71 @@ class MpesaSettings(Document):
             frappe.throw(_(response.errorMessage),
                          title=_("Transaction Error"))
 
+    def handle_api_responses(self, global_id, request_dicts, responses):
+        """Log several API responses with a single bulk insert and return their error messages."""
+        logs, errors = [], []
+        for request_dict, response in zip(request_dicts, responses, strict=True):
+            if response.requestId:
+                logs.append((response.requestId, request_dict, response))
+                errors.append(_(response.errorMessage))
+            else:
+                logs.append((getattr(response, global_id), request_dict, None))
 
-def generate_stk_push(**kwargs):
-    """Generate stk push by making a API call to the stk push API."""
-    args = frappe._dict(kwargs)
-    try:
-        callback_url = (
-            get_request_site_address(True)
-            + "/api/method/payments.payment_gateways.doctype.mpesa_settings.mpesa_settings.verify_transaction"
-        )
-
-        mpesa_settings = frappe.get_doc(
-            "Mpesa Settings", args.payment_gateway[6:])
-        env = "production" if not mpesa_settings.sandbox else "sandbox"
-        # for sandbox, business shortcode is same as till number
-        business_shortcode = (
-            mpesa_settings.business_shortcode if env == "production" else mpesa_settings.till_number
-        )
+        bulk_create_request_logs(logs, service_name="Mpesa")
+        return errors
 
-        connector = MpesaConnector(
-            env=env,
-            app_key=mpesa_settings.consumer_key,
-            app_secret=mpesa_settings.get_password("consumer_secret"),
-        )
 
-        mobile_number = sanitize_mobile_number(args.sender)
+def generate_stk_pushes(request_amounts, **kwargs):
+    """Send one stk push per amount concurrently.
 
-        return connector.stk_push(
-            business_shortcode=business_shortcode,
-            amount=args.request_amount,
-            passcode=mpesa_settings.get_password("online_passkey"),
-            callback_url=callback_url,
-            reference_code=mpesa_settings.till_number,
-            phone_number=mobile_number,
-            description="POS Payment",
-        )
+    Returns a list of `(response, exception)` tuples in the order of `request_amounts`."""
+    args = frappe._dict(kwargs)
+    try:
+        connector, stk_push_args = get_stk_push_connector(args)
     except Exception as e:
-        frappe.log_error(f"[mpesa_settings.py] get_payment_request: {str(e)}")
+        frappe.log_error(f"[mpesa_settings.py] get_payment_request: {e!s}")
         frappe.throw(
             _("Issue detected with Mpesa configuration, check the error logs for more details"),
             title=_("Mpesa Express Error"),
         )
 
+    return map_concurrently(
+        lambda amount: connector.stk_push(amount=amount, **stk_push_args),
+        request_amounts,
+        cint(frappe.conf.mpesa_stk_push_workers) or STK_PUSH_WORKERS,
+    )
+
+
+def get_stk_push_connector(args):
+    """Return an authenticated connector and the stk push arguments shared by every split request."""
+    callback_url = (
+        get_request_site_address(True)
+        + "/api/method/payments.payment_gateways.doctype.mpesa_settings.mpesa_settings.verify_transaction"
+    )
+
+    mpesa_settings = frappe.get_doc(
+        "Mpesa Settings", args.payment_gateway[6:])
+    env = "production" if not mpesa_settings.sandbox else "sandbox"
+    # for sandbox, business shortcode is same as till number
+    business_shortcode = (
+        mpesa_settings.business_shortcode if env == "production" else mpesa_settings.till_number
+    )
+
+    connector = MpesaConnector(
+        env=env,
+        app_key=mpesa_settings.consumer_key,
+        app_secret=mpesa_settings.get_password("consumer_secret"),
+    )
+
+    return connector, dict(
+        business_shortcode=business_shortcode,
+        passcode=mpesa_settings.get_password("online_passkey"),
+        callback_url=callback_url,
+        reference_code=mpesa_settings.till_number,
+        phone_number=sanitize_mobile_number(args.sender),
+        description="POS Payment",
+    )
+
 
 def sanitize_mobile_number(number):
     """Add country code and strip leading zeroes from the phone number."""
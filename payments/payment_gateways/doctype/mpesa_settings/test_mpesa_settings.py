@@ -3,6 +3,8 @@
 
 import unittest
 from json import dumps
+from typing import ClassVar
+from unittest.mock import patch
 
 import frappe
 from erpnext.accounts.doctype.payment_entry.test_payment_entry import create_customer
@@ -11,8 +13,10 @@ from erpnext.accounts.doctype.pos_opening_entry.test_pos_opening_entry import cr
 from erpnext.accounts.doctype.pos_profile.test_pos_profile import make_pos_profile
 from erpnext.stock.doctype.item.test_item import make_item
 
+from payments.payment_gateways.doctype.mpesa_settings import mpesa_settings
 from payments.payment_gateways.doctype.mpesa_settings.mpesa_settings import (
 	create_mode_of_payment,
+	generate_stk_pushes,
 	process_balance_info,
 	verify_transaction,
 )
@@ -42,6 +46,8 @@ class TestMpesaSettings(unittest.TestCase):
 		self.pos_profile = pos_profile
 
 	def tearDown(self):
+		FakeMpesaConnector.instances = 0
+		FakeMpesaConnector.checkout_ids = []
 		frappe.db.rollback()
 		for x in frappe.db.get_all("POS Opening Entry"):
 			frappe.get_doc("POS Opening Entry", x.name).cancel().delete()
@@ -300,6 +306,78 @@ class TestMpesaSettings(unittest.TestCase):
 		pr.delete()
 		pos_invoice.delete()
 
+	def test_concurrent_stk_pushes(self):
+		with patch.object(mpesa_settings, "MpesaConnector", FakeMpesaConnector):
+			results = generate_stk_pushes([150, 150, 30], payment_gateway="Mpesa-_Test", sender="0712345678")
+
+		# one connector is shared by all pushes, results keep the order of the amounts
+		self.assertEqual(FakeMpesaConnector.instances, 1)
+		self.assertEqual(
+			[response["CallbackMetadata"]["Item"][0]["Value"] for response, _error in results], [150, 150, 30]
+		)
+		self.assertEqual([error for _response, error in results], [None, None, None])
+
+	def test_request_for_payment_sends_split_requests(self):
+		mpesa_doc = create_mpesa_settings(payment_gateway_name="_Test")
+		mpesa_doc.transaction_limit = 150
+
+		with (
+			patch.object(mpesa_settings, "MpesaConnector", FakeMpesaConnector),
+			patch.object(frappe.flags, "in_test", False),
+		):
+			mpesa_doc.request_for_payment(
+				payment_gateway="Mpesa-_Test", request_amount=330, sender="0712345678"
+			)
+
+		integration_requests = frappe.get_all(
+			"Integration Request",
+			filters={"name": ("in", FakeMpesaConnector.checkout_ids)},
+			fields=["name", "status", "data"],
+		)
+		self.assertEqual(len(integration_requests), 3)
+		self.assertEqual(
+			sorted(frappe.parse_json(request.data).request_amount for request in integration_requests),
+			[30, 150, 150],
+		)
+
+	def test_failed_stk_push_is_reported(self):
+		mpesa_doc = create_mpesa_settings(payment_gateway_name="_Test")
+		mpesa_doc.transaction_limit = 150
+
+		with (
+			patch.object(mpesa_settings, "MpesaConnector", FakeMpesaConnector),
+			patch.object(frappe.flags, "in_test", False),
+			patch.object(FakeMpesaConnector, "failing_amount", 30),
+			self.assertRaises(frappe.ValidationError),
+		):
+			mpesa_doc.request_for_payment(
+				payment_gateway="Mpesa-_Test", request_amount=330, sender="0712345678"
+			)
+
+		# the pushes that went through are still logged
+		self.assertEqual(
+			frappe.db.count("Integration Request", {"name": ("in", FakeMpesaConnector.checkout_ids)}), 2
+		)
+
+
+class FakeMpesaConnector:
+	"""Answers stk pushes like Mpesa does, and fails those of `failing_amount`"""
+
+	instances = 0
+	checkout_ids: ClassVar[list] = []
+	failing_amount = None
+
+	def __init__(self, **kwargs):
+		FakeMpesaConnector.instances += 1
+
+	def stk_push(self, amount=None, **kwargs):
+		if amount == self.failing_amount:
+			raise ConnectionError("stk push failed")
+
+		response = get_payment_request_response_payload(amount)
+		FakeMpesaConnector.checkout_ids.append(response["CheckoutRequestID"])
+		return response
+
 
 def create_mpesa_settings(payment_gateway_name="Express"):
 	if frappe.db.exists("Mpesa Settings", payment_gateway_name):
@@ -17,8 +17,7 @@ frappe.ui.form.on("Paymob Settings", {
           freeze_message: __("Getting Access Token ..."),
         })
         .then((r) => {
-          if (!r.exc && r.message) {
-            frm.set_value("token", r.message);
+          if (!r.exc) {
             frappe.show_alert({
               message: __("Access Token Updated"),
               indicator: "green",
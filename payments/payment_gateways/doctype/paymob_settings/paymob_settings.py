@@ -1,19 +1,26 @@
 # Copyright (c) 2025, Frappe Technologies and contributors
 # For license information, please see license.txt
 
-from datetime import timedelta
 from urllib.parse import urlencode
 
 import frappe
 from frappe import _
-from frappe.integrations.utils import create_request_log, make_get_request, make_post_request
+from frappe.integrations.utils import create_request_log
 from frappe.model.document import Document
-from frappe.utils import get_datetime, now_datetime
 
-from payments.payment_gateways.paymob.accept_api import AcceptAPI
-from payments.payment_gateways.paymob.hmac_validator import HMACValidator
+from payments.payment_gateways.paymob.connection import (
+	AUTH_TOKEN_CACHE_KEY,
+	AcceptConnection,
+)
+from payments.payment_gateways.paymob.hmac_validator import HMACValidator, clear_hmac_secret_cache
 from payments.payment_gateways.paymob.paymob_urls import PaymobUrls
 from payments.payment_gateways.paymob.response_codes import SUCCESS
+from payments.utils import (
+	enqueue_webhook_event,
+	get_integration_request_by_reference,
+	make_post_request,
+	record_webhook_event,
+)
 
 
 class PaymobSettings(Document):
@@ -31,35 +38,25 @@ class PaymobSettings(Document):
 		payment_integration: DF.Int
 		public_key: DF.Password
 		secret_key: DF.Password
-		token: DF.Password | None
 	# end: auto-generated types
 
+	def on_update(self):
+		# credentials may have changed, don't keep handing out the old token
+		frappe.cache().delete_value(AUTH_TOKEN_CACHE_KEY)
+		clear_hmac_secret_cache()
+
 	@frappe.whitelist()
 	def refresh_access_token(self):
 		"""
-		If existing token expired → fetch new one
+		Discard the shared token and fetch a new one, which stays in the cache only
 		"""
 
-		accept = AcceptAPI()
-		token = accept.retrieve_auth_token()
-		self.token = token
-		self.expires_in = now_datetime() + timedelta(minutes=50)
-		self.save(ignore_permissions=True)
-
-		return token
+		frappe.cache().delete_value(AUTH_TOKEN_CACHE_KEY)
+		self.get_valid_token()
 
 	def get_valid_token(self):
-		token = self.get_password("token") if self.token else None
-
-		buffer = timedelta(minutes=2)
-		if token and self.expires_in:
-			expires_in = (
-				get_datetime(self.expires_in) if isinstance(self.expires_in, str) else self.expires_in
-			)
-			if now_datetime() + buffer < expires_in:
-				return token
-
-		return self.refresh_access_token()
+		"""Return the auth token shared by all workers, refreshed by only one of them when due"""
+		return AcceptConnection().auth_token
 
 	def get_payment_url(self, **kwargs):
 		try:
@@ -146,6 +143,7 @@ class PaymobSettings(Document):
 			order["integration_request"] = integration_request.name
 
 			integration_request.data = frappe.as_json(integration_request_dict)
+			integration_request.gateway_reference = str(paymob_order_id)
 			integration_request.save(ignore_permissions=True)
 			frappe.db.commit()
 
@@ -157,6 +155,8 @@ class PaymobSettings(Document):
 
 @frappe.whitelist(allow_guest=True)
 def callback():
+	"""Verify and store the callback, the payment itself is processed in the background
+	so that slow `on_payment_authorized` hooks never hold up Paymob's request"""
 	try:
 		incoming_hmac = frappe.request.args.get("hmac") or frappe.request.form.get("hmac")
 
@@ -171,76 +171,87 @@ def callback():
 		if not validator.is_valid:
 			frappe.throw(_("Invalid HMAC"))
 
-		obj_data = incoming_data_json.get("obj", {})
-		success = obj_data.get("success")
-		pending = obj_data.get("pending")
-		payment_status = obj_data.get("order", {}).get("payment_status")
-		txn_response_code = obj_data.get("data", {}).get("txn_response_code")
-		migs_data = obj_data.get("data", {}).get("migs_order", {})
-		capture_status = migs_data.get("status")
-		paymob_payment_id = obj_data.get("id")
-		paymob_order_id = obj_data.get("order", {}).get("id")
-
-		is_payment_successful = (
-			success is True
-			and pending is False
-			and str(payment_status).upper() == "PAID"
-			and str(txn_response_code).upper() == "APPROVED"
+		paymob_payment_id = incoming_data_json.get("obj", {}).get("id")
+		if not paymob_payment_id:
+			frappe.throw(_("Missing transaction ID"))
+
+		# Paymob retries callbacks, the transaction id makes them idempotent
+		name = record_webhook_event("Paymob", paymob_payment_id, incoming_data_json)
+		if not name:
+			return
+
+		enqueue_webhook_event(
+			name, "payments.payment_gateways.doctype.paymob_settings.paymob_settings.process_callback"
 		)
 
-		if not paymob_order_id:
-			frappe.throw(_("Missing order ID"))
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "Paymob Callback Error")
 
-		integration_request_doc = get_integration_request(paymob_order_id)
-		integration_request_dict = frappe.parse_json(integration_request_doc.data)
 
-		integration_request_dict.update(
-			{
-				"paymob_payment_id": str(paymob_payment_id),
-				"order_id": str(paymob_order_id),
-			}
-		)
+def process_callback(doctype, docname):
+	"""Apply a stored Paymob callback to the Integration Request of its order"""
+	handle_callback(frappe.parse_json(frappe.db.get_value(doctype, docname, "data")))
 
-		integration_request_doc.data = frappe.as_json(integration_request_dict)
 
-		if is_payment_successful:
-			if capture_status == "CAPTURED":
-				integration_request_doc.status = "Completed"
+def handle_callback(incoming_data_json):
+	obj_data = incoming_data_json.get("obj", {})
+	success = obj_data.get("success")
+	pending = obj_data.get("pending")
+	payment_status = obj_data.get("order", {}).get("payment_status")
+	txn_response_code = obj_data.get("data", {}).get("txn_response_code")
+	migs_data = obj_data.get("data", {}).get("migs_order", {})
+	capture_status = migs_data.get("status")
+	paymob_payment_id = obj_data.get("id")
+	paymob_order_id = obj_data.get("order", {}).get("id")
 
-			integration_request_doc.save(ignore_permissions=True)
-			frappe.db.commit()
+	is_payment_successful = (
+		success is True
+		and pending is False
+		and str(payment_status).upper() == "PAID"
+		and str(txn_response_code).upper() == "APPROVED"
+	)
 
-			handle_payment_success(integration_request_dict)
+	if not paymob_order_id:
+		frappe.throw(_("Missing order ID"))
 
-		else:
-			integration_request_doc.error = (
-				f"Payment Status: {payment_status}, Response Code: {txn_response_code}"
-			)
-			integration_request_doc.save(ignore_permissions=True)
-			frappe.db.commit()
-			frappe.log_error(frappe.get_traceback(), "Paymob Payment not authorized")
+	integration_request_doc = get_integration_request(paymob_order_id)
+	integration_request_dict = frappe.parse_json(integration_request_doc.data)
 
-	except Exception:
-		frappe.log_error(frappe.get_traceback(), "Paymob Callback Error")
+	integration_request_dict.update(
+		{
+			"paymob_payment_id": str(paymob_payment_id),
+			"order_id": str(paymob_order_id),
+		}
+	)
+
+	integration_request_doc.data = frappe.as_json(integration_request_dict)
+
+	if is_payment_successful:
+		if capture_status == "CAPTURED":
+			integration_request_doc.status = "Completed"
+
+		integration_request_doc.save(ignore_permissions=True)
+		frappe.db.commit()
+
+		handle_payment_success(integration_request_dict)
+
+	else:
+		integration_request_doc.error = (
+			f"Payment Status: {payment_status}, Response Code: {txn_response_code}"
+		)
+		integration_request_doc.save(ignore_permissions=True)
+		frappe.db.commit()
+		frappe.log_error(frappe.get_traceback(), "Paymob Payment not authorized")
 
 
 def get_integration_request(paymob_order_id):
 	"""Fetch Integration Request linked to Paymob order."""
 
-	integration_requests = frappe.get_all(
-		"Integration Request",
-		filters={
-			"integration_request_service": "Paymob",
-			"data": ["like", f'%"paymob_order_id": "{paymob_order_id}"%'],
-		},
-		fields=["name", "data", "reference_doctype", "reference_docname"],
-		order_by="creation desc",
-		limit=1,
-	)
-	if not integration_requests:
+	integration_request = get_integration_request_by_reference("Paymob", paymob_order_id)
+	if not integration_request:
 		frappe.throw(_("No Integration Request found for this order"))
 
-	return frappe.get_doc("Integration Request", integration_requests[0].name)
+	return frappe.get_doc("Integration Request", integration_request)
 
 
 def handle_payment_success(integration_request_dict):
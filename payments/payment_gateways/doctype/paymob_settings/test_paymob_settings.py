@@ -1,9 +1,124 @@
 # Copyright (c) 2025, Frappe Technologies and Contributors
 # See license.txt
 
-# import frappe
+import copy
+from unittest.mock import patch
+
 from frappe.tests.utils import FrappeTestCase
+from requests import RequestException
+
+from payments.payment_gateways.paymob import connection, hmac_validator
+from payments.payment_gateways.paymob.connection import AcceptConnection
+from payments.payment_gateways.paymob.hmac_validator import HMACValidator
+from payments.payment_gateways.paymob.response_codes import REQUEST_EXCEPTION
+
+SECRET = b"paymob-test-secret"
+
+TRANSACTION_CALLBACK = {
+	"type": "TRANSACTION",
+	"obj": {
+		"amount_cents": 10000,
+		"created_at": "2025-01-01T10:00:00.000000",
+		"currency": "EGP",
+		"error_occured": False,
+		"has_parent_transaction": False,
+		"id": 192036465,
+		"integration_id": 4097558,
+		"is_3d_secure": True,
+		"is_auth": False,
+		"is_capture": False,
+		"is_refunded": False,
+		"is_standalone_payment": True,
+		"is_voided": False,
+		"order": {"id": 217503754},
+		"owner": 1820424,
+		"pending": False,
+		"source_data": {"pan": "2346", "sub_type": "MasterCard", "type": "card"},
+		"success": True,
+	},
+}
+TRANSACTION_HMAC = "63666bc705a6dda52ea1beaf3de71a8eee4b0073bc3ae660cab449d02abd54dbd9e56bd3f8f99a6bd883e8d4050fd835aa56454ace080e846e72341e33893937"
+# the same transaction without `order` and `source_data`, their fields are left out of the message
+TRANSACTION_WITHOUT_NESTED_HMAC = "49fa567680f756951f8ab0bab40b526217d6d0d424f9970d179bd13301c4abfbc2deb169fe49557ac04bc6c7e8f5845f3a441158fe1cef906d4791810de74765"
+
+CARD_TOKEN_CALLBACK = {
+	"type": "TOKEN",
+	"obj": {
+		"card_subtype": "MasterCard",
+		"created_at": "2025-01-01T10:00:00.000000",
+		"email": "student@example.com",
+		"id": 8891234,
+		"masked_pan": "xxxx-xxxx-xxxx-2346",
+		"merchant_id": 1820424,
+		"order_id": 217503754,
+		"token": "d1f8a9c2e3b4",
+	},
+}
+CARD_TOKEN_HMAC = "26d837373c5674bf896b6dc3d9ee0f428f5f3857455dcd18a5d6331b140889230ffd09ca85563d6064fa3b410a359277f5d07faca3cdbb8665627a7a4cc9f933"
+
+DELIVERY_STATUS_CALLBACK = {
+	"type": "DELIVERY_STATUS",
+	"obj": {
+		"order_id": 217503754,
+		"order_delivery_status": "Delivered",
+		"merchant_id": 1820424,
+		"merchant_name": "Example Merchant",
+		"updated_at": "2025-01-02T12:30:00.000000",
+	},
+}
+DELIVERY_STATUS_HMAC = "57e280e81b54861fd8e0cadb07c137ade42d2cb4da238aff303d675498bb2ed3cf0d642e7d84d938f4cdbf8f4ce8de7bf4cb1538e46615b3056d4bd4f51718b2"
 
 
 class TestPaymobSettings(FrappeTestCase):
-	pass
+	def setUp(self):
+		patcher = patch.object(hmac_validator, "get_hmac_secret", return_value=SECRET)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def is_valid(self, incoming_hmac, callback):
+		return HMACValidator(incoming_hmac=incoming_hmac, callback_dict=callback).is_valid
+
+	def test_known_hmacs(self):
+		for callback, incoming_hmac in (
+			(TRANSACTION_CALLBACK, TRANSACTION_HMAC),
+			(CARD_TOKEN_CALLBACK, CARD_TOKEN_HMAC),
+			(DELIVERY_STATUS_CALLBACK, DELIVERY_STATUS_HMAC),
+		):
+			with self.subTest(callback["type"]):
+				self.assertTrue(self.is_valid(incoming_hmac, callback))
+
+				tampered = copy.deepcopy(callback)
+				tampered["obj"]["created_at"] = "2025-01-03T00:00:00.000000"
+				self.assertFalse(self.is_valid(incoming_hmac, tampered))
+
+	def test_upper_case_hmac(self):
+		self.assertTrue(self.is_valid(TRANSACTION_HMAC.upper(), TRANSACTION_CALLBACK))
+
+	def test_missing_nested_objects(self):
+		callback = copy.deepcopy(TRANSACTION_CALLBACK)
+		del callback["obj"]["order"]
+		callback["obj"]["source_data"] = None
+
+		self.assertTrue(self.is_valid(TRANSACTION_WITHOUT_NESTED_HMAC, callback))
+		self.assertFalse(self.is_valid(TRANSACTION_HMAC, callback))
+
+	def test_unknown_callback_type(self):
+		callback = dict(TRANSACTION_CALLBACK, type="REFUND")
+
+		self.assertFalse(self.is_valid(TRANSACTION_HMAC, callback))
+		self.assertFalse(self.is_valid(TRANSACTION_HMAC, {"obj": TRANSACTION_CALLBACK["obj"]}))
+
+
+class TestPaymobConnection(FrappeTestCase):
+	def test_failed_token_is_reported(self):
+		accept = AcceptConnection()
+
+		with (
+			patch.object(connection, "get_cached_token", side_effect=RequestException("auth failed")),
+			patch.object(accept.session, "post") as post,
+		):
+			code, feedback = accept.post(url=accept.paymob_urls.get_url("order"), json={})
+
+		self.assertEqual(code, REQUEST_EXCEPTION)
+		self.assertEqual(str(feedback.exception_error), "auth failed")
+		post.assert_not_called()
@@ -68,12 +68,17 @@ from zoneinfo import ZoneInfo
 
 import frappe
 from frappe import _
-from frappe.integrations.utils import create_request_log, make_post_request
+from frappe.integrations.utils import create_request_log
 from frappe.model.document import Document
 from frappe.utils import call_hook_method, cint, get_datetime, get_url
 from frappe.utils.data import get_system_timezone
 
-from payments.utils import create_payment_gateway
+from payments.utils import (
+    create_payment_gateway,
+    enqueue_webhook_event,
+    make_post_request,
+    record_webhook_event,
+)
 
 api_path = "/api/method/payments.payment_gateways.doctype.paypal_settings.paypal_settings"
 
@@ -195,7 +200,9 @@ class PayPalSettings(Document):
             }
         )
 
-        create_request_log(kwargs, service_name="PayPal", name=kwargs["token"])
+        create_request_log(
+            kwargs, service_name="PayPal", name=kwargs["token"], gateway_reference=kwargs["token"]
+        )
 
         return return_url.format(kwargs["token"])
 
@@ -482,23 +489,18 @@ def ipn_handler():
 
         data.update({"payment_gateway": "PayPal"})
 
-        doc = frappe.get_doc(
-            {
-                "data": json.dumps(frappe.local.form_dict),
-                "doctype": "Integration Request",
-                "request_description": "Subscription Notification",
-                "is_remote_request": 1,
-                "status": "Queued",
-            }
-        ).insert(ignore_permissions=True)
-        frappe.db.commit()
+        # PayPal resends an IPN with the same ipn_track_id until it is acknowledged
+        name = record_webhook_event(
+            "PayPal", data.get("ipn_track_id"), data, request_description="Subscription Notification"
+        )
+        if not name:
+            return
 
-        frappe.enqueue(
-            method="payments.payment_gateways.doctype.paypal_settings.paypal_settings.handle_subscription_notification",
+        enqueue_webhook_event(
+            name,
+            "payments.payment_gateways.doctype.paypal_settings.paypal_settings.handle_subscription_notification",
             queue="long",
             timeout=600,
-            is_async=True,
-            **{"doctype": "Integration Request", "docname": doc.name},
         )
 
     except frappe.InvalidStatusError:
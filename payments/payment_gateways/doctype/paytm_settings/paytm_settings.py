@@ -5,7 +5,6 @@ import json
 from urllib.parse import urlencode
 
 import frappe
-import requests
 from frappe import _
 from frappe.integrations.utils import create_request_log
 from frappe.model.document import Document
@@ -20,7 +19,7 @@ from frappe.utils import (
 from frappe.utils.password import get_decrypted_password
 from paytmchecksum import generateSignature, verifySignature
 
-from payments.utils import create_payment_gateway
+from payments.utils import create_payment_gateway, get_session
 
 
 class PaytmSettings(Document):
@@ -142,8 +141,8 @@ def verify_transaction_status(paytm_config, order_id):
     post_data = json.dumps(paytm_params)
     url = paytm_config.transaction_status_url
 
-    response = requests.post(url, data=post_data, headers={
-                             "Content-type": "application/json"}).json()
+    response = get_session(url).post(url, data=post_data, headers={
+                                     "Content-type": "application/json"}).json()
     finalize_request(order_id, response)
 
 
@@ -62,20 +62,34 @@ For razorpay payment status is Authorized
 import hashlib
 import hmac
 import json
+import time
+from traceback import format_exception
 from urllib.parse import urlencode
 
 import frappe
 import razorpay
 from frappe import _
-from frappe.integrations.utils import (
-	create_request_log,
+from frappe.integrations.utils import create_request_log
+from frappe.model.document import Document
+from frappe.utils import add_to_date, call_hook_method, cint, get_timestamp, get_url, now_datetime
+
+from payments.utils import (
+	create_payment_gateway,
+	enqueue_webhook_event,
+	get_session,
 	make_get_request,
 	make_post_request,
+	map_concurrently,
+	record_webhook_event,
 )
-from frappe.model.document import Document
-from frappe.utils import call_hook_method, cint, get_timestamp, get_url
 
-from payments.utils import create_payment_gateway
+CAPTURE_WORKERS = 8
+CAPTURE_BATCH_SIZE = 500
+CAPTURE_LEASE = 15 * 60
+# batches at least this large are reconciled against a listing of payments
+RECONCILE_MIN_BATCH = 20
+PAYMENTS_PAGE_SIZE = 100  # the most Razorpay returns per page
+WEBHOOK_SETTINGS_CACHE_KEY = "razorpay_webhook_settings"
 
 
 class RazorpaySettings(Document):
@@ -215,7 +229,9 @@ class RazorpaySettings(Document):
 	def init_client(self):
 		if self.api_key:
 			secret = self.get_password(fieldname="api_secret", raise_exception=False)
-			self.client = razorpay.Client(auth=(self.api_key, secret))
+			self.client = razorpay.Client(
+				session=get_session("https://api.razorpay.com"), auth=(self.api_key, secret)
+			)
 
 	def validate(self):
 		create_payment_gateway("Razorpay")
@@ -223,6 +239,9 @@ class RazorpaySettings(Document):
 		if not self.flags.ignore_mandatory:
 			self.validate_razorpay_credentails()
 
+	def on_update(self):
+		frappe.cache().delete_value(WEBHOOK_SETTINGS_CACHE_KEY)
+
 	def validate_razorpay_credentails(self):
 		if self.api_key and self.api_secret:
 			try:
@@ -256,22 +275,45 @@ class RazorpaySettings(Document):
 		        },
 		        "quantity": 1 (The total amount is calculated as item.amount * quantity)
 		}
+
+		The created add-on ids and any errors are written onto the checkout's Integration
+		Request, passed as `token`, in one update and without committing.
 		"""
 		url = "https://api.razorpay.com/v1/subscriptions/{}/addons".format(kwargs.get("subscription_id"))
+		auth = (settings.api_key, settings.api_secret)
 
 		try:
 			if not frappe.conf.converted_rupee_to_paisa:
 				convert_rupee_to_paisa(**kwargs)
 
-			for addon in kwargs.get("addons"):
-				resp = make_post_request(
-					url,
-					auth=(settings.api_key, settings.api_secret),
-					data=json.dumps(addon),
-					headers={"content-type": "application/json"},
+			# add-ons are independent of each other, create them all at once
+			addons = kwargs.get("addons") or []
+			session = get_session(url)
+			results = map_concurrently(lambda addon: create_razorpay_addon(session, url, auth, addon), addons)
+
+			addon_ids, errors = [], []
+			for addon, (resp, error) in zip(addons, results, strict=True):
+				name = (addon.get("item") or {}).get("name")
+				if error:
+					errors.append(f"{name}: {''.join(format_exception(error))}")
+				elif not (resp or {}).get("id"):
+					errors.append(f"{name}: {resp}")
+				else:
+					addon_ids.append(resp["id"])
+
+			if integration_request := kwargs.get("token"):
+				frappe.db.set_value(
+					"Integration Request",
+					integration_request,
+					{
+						"output": frappe.as_json({"addon_ids": addon_ids}),
+						"error": "\n".join(errors) or None,
+					},
+				)
+			if errors:
+				frappe.log_error(
+					message="\n".join(errors), title="Razorpay Failed while creating subscription"
 				)
-				if not resp.get("id"):
-					frappe.log_error(message=str(resp), title="Razorpay Failed while creating subscription")
 		except Exception:
 			frappe.log_error()
 			# failed
@@ -325,11 +367,15 @@ class RazorpaySettings(Document):
 		return kwargs
 
 	def get_payment_url(self, **kwargs):
+		gateway_reference = None
 		if not kwargs.get("order_id"):
-			order = self.create_order(**kwargs)
-			kwargs.update({"order_id": order.get("id")})
+			order = self.post_order(dict(kwargs, amount=int(kwargs["amount"] * 100)))
+			kwargs["order_id"] = gateway_reference = order.get("id")
 
-		integration_request = create_request_log(kwargs, service_name="Razorpay")
+		# the one request of this checkout, its name is the checkout token
+		integration_request = create_request_log(
+			kwargs, service_name="Razorpay", gateway_reference=gateway_reference
+		)
 		return get_url(f"./razorpay_checkout?token={integration_request.name}")
 
 	def create_order(self, **kwargs):
@@ -338,31 +384,39 @@ class RazorpaySettings(Document):
 		# convert rupees to paisa
 		kwargs["amount"] = int(kwargs["amount"] * 100)
 
+		order = self.post_order(kwargs)
+
 		# Create integration log
-		integration_request = create_request_log(kwargs, service_name="Razorpay")
+		integration_request = create_request_log(
+			kwargs, service_name="Razorpay", gateway_reference=order.get("id")
+		)
+		order["integration_request"] = integration_request.name
+		return order  # Order returned to be consumed by razorpay.js
 
-		# Setup payment options
+	def post_order(self, kwargs):
+		"""Create the order on Razorpay, `amount` in paisa, without logging it"""
 		payment_options = {
 			"amount": kwargs.get("amount"),
 			"currency": kwargs.get("currency", "INR"),
 			"receipt": kwargs.get("receipt"),
 			"payment_capture": kwargs.get("payment_capture"),
 		}
-		if self.api_key and self.api_secret:
-			try:
-				order = make_post_request(
-					"https://api.razorpay.com/v1/orders",
-					auth=(
-						self.api_key,
-						self.get_password(fieldname="api_secret", raise_exception=False),
-					),
-					data=payment_options,
-				)
-				order["integration_request"] = integration_request.name
-				return order  # Order returned to be consumed by razorpay.js
-			except Exception:
-				frappe.log(frappe.get_traceback())
-				frappe.throw(_("Could not create razorpay order"))
+
+		if not (self.api_key and self.api_secret):
+			frappe.throw(_("Razorpay API Key and API Secret are required to create an order"))
+
+		try:
+			return make_post_request(
+				"https://api.razorpay.com/v1/orders",
+				auth=(
+					self.api_key,
+					self.get_password(fieldname="api_secret", raise_exception=False),
+				),
+				data=payment_options,
+			)
+		except Exception:
+			frappe.log(frappe.get_traceback())
+			frappe.throw(_("Could not create razorpay order"))
 
 	def create_request(self, data):
 		self.data = frappe._dict(data)
@@ -402,6 +456,7 @@ class RazorpaySettings(Document):
 			if resp.get("status") == "authorized":
 				self.integration_request.update_status(data, "Authorized")
 				self.flags.status_changed_to = "Authorized"
+				enqueue_capture(self.integration_request.name)
 
 			elif resp.get("status") == "captured":
 				self.integration_request.update_status(data, "Completed")
@@ -462,7 +517,7 @@ class RazorpaySettings(Document):
 			}
 		)
 
-		if cint(data.get("notes", {}).get("use_sandbox")) or data.get("use_sandbox"):
+		if use_sandbox(data):
 			settings.update(
 				{
 					"api_key": frappe.conf.sandbox_api_key,
@@ -511,46 +566,247 @@ def capture_payment(is_sandbox=False, sanbox_response=None):
 	After capture, the amount is transferred to the merchant within T+3 days
 	where T is the day on which payment is captured.
 
+	Payments are normally captured right after authorization by `enqueue_capture`, this
+	hourly sweep picks up whatever that missed. The sweep is split across `Capture Shards` background workers. Each worker leases
+	Authorized requests in batches, so no payment is ever picked up by two workers.
+
 	Note: Attempting to capture a payment whose status is not authorized will produce an error.
 	"""
+	shards = cint(frappe.db.get_single_value("Razorpay Settings", "capture_shards")) or 1
+
+	if shards > 1 and not is_sandbox:
+		for shard in range(shards):
+			frappe.enqueue(
+				"payments.payment_gateways.doctype.razorpay_settings.razorpay_settings.capture_claimed_payments",
+				queue="long",
+				job_id=f"razorpay_capture_shard_{shard}",
+				deduplicate=True,
+			)
+		return
+
+	capture_claimed_payments(is_sandbox, sanbox_response)
+
+
+def enqueue_capture(integration_request):
+	"""Capture an Authorized payment in the background.
+
+	`IntegrationRequest.update_status` has already committed the authorization, so the job
+	is enqueued right away rather than after a commit that may never come.
+	"""
+	frappe.enqueue(
+		"payments.payment_gateways.doctype.razorpay_settings.razorpay_settings.capture_claimed_payments",
+		queue="short",
+		job_id=f"razorpay_capture_{integration_request}",
+		deduplicate=True,
+		names=[integration_request],
+	)
+
+
+def capture_claimed_payments(is_sandbox=False, sanbox_response=None, names=None, reconcile=None):
+	"""
+	Claim and capture Authorized payments, only those in `names` if given, until none are left to claim.
+
+	Each claimed batch is checked and captured on a bounded worker pool
+	(`razorpay_capture_workers` in site config) over the shared keep-alive HTTP session,
+	and its status updates are written back in bulk.
+
+	With `reconcile`, by default for batches of `RECONCILE_MIN_BATCH` or more, payments are
+	checked against a paginated listing instead of one `GET /v1/payments/{id}` each.
+	"""
 	controller = frappe.get_doc("Razorpay Settings")
+	claimed_by = frappe.generate_hash(length=12)
 
-	for doc in frappe.get_all(
-		"Integration Request",
-		filters={"status": "Authorized", "integration_request_service": "Razorpay"},
-		fields=["name", "data"],
-	):
-		try:
-			if is_sandbox:
-				resp = sanbox_response
-			else:
+	settings_by_mode = {}
+	max_workers = cint(frappe.conf.razorpay_capture_workers) or CAPTURE_WORKERS
+	session = get_session("https://api.razorpay.com")
+
+	while batch := claim_authorized_requests(claimed_by, CAPTURE_BATCH_SIZE, names):
+		if is_sandbox:
+			results = [(sanbox_response, None)] * len(batch)
+		else:
+			jobs = []
+			for doc in batch:
 				data = json.loads(doc.data)
-				settings = controller.get_settings(data)
+				mode = use_sandbox(data)
+				if mode not in settings_by_mode:
+					settings_by_mode[mode] = controller.get_settings(data)
+
+				settings = settings_by_mode[mode]
+				jobs.append(
+					(
+						(settings.api_key, settings.api_secret),
+						data.get("razorpay_payment_id"),
+						data.get("amount"),
+					)
+				)
 
-				resp = make_get_request(
-					"https://api.razorpay.com/v1/payments/{}".format(data.get("razorpay_payment_id")),
-					auth=(settings.api_key, settings.api_secret),
-					data={"amount": data.get("amount")},
+			if reconcile or (reconcile is None and len(batch) >= RECONCILE_MIN_BATCH):
+				# a day of margin covers the site's timezone, payments are created after their request
+				from_timestamp = int(get_timestamp(min(doc.creation for doc in batch))) - 24 * 60 * 60
+				results = reconcile_razorpay_payments(session, jobs, from_timestamp, max_workers)
+			else:
+				results = map_concurrently(
+					lambda job: capture_razorpay_payment(session, *job), jobs, max_workers
 				)
 
-				if resp.get("status") == "authorized":
-					resp = make_post_request(
-						"https://api.razorpay.com/v1/payments/{}/capture".format(
-							data.get("razorpay_payment_id")
-						),
-						auth=(settings.api_key, settings.api_secret),
-						data={"amount": data.get("amount")},
-					)
+		update_captured_requests(batch, results)
+		frappe.db.commit()
 
-			if resp.get("status") == "captured":
-				frappe.db.set_value("Integration Request", doc.name, "status", "Completed")
 
+def claim_authorized_requests(claimed_by, limit, names=None):
+	"""Lease up to `limit` unclaimed Authorized requests, out of `names` if given, to `claimed_by`.
+
+	The lease is taken with a conditional UPDATE that only matches rows without a live
+	lease, so concurrent workers never end up holding the same request. Requests that
+	stay Authorized after a capture attempt are retried once their lease expires.
+	"""
+	now = now_datetime()
+	IntegrationRequest = frappe.qb.DocType("Integration Request")
+	claimable = (
+		(IntegrationRequest.status == "Authorized")
+		& (IntegrationRequest.integration_request_service == "Razorpay")
+		& (
+			IntegrationRequest.capture_claim_expires_on.isnull()
+			| (IntegrationRequest.capture_claim_expires_on < now)
+		)
+	)
+	if names:
+		claimable &= IntegrationRequest.name.isin(names)
+
+	while candidates := (
+		frappe.qb.from_(IntegrationRequest)
+		.select(IntegrationRequest.name)
+		.where(claimable)
+		.orderby(IntegrationRequest.creation)
+		.limit(limit)
+		.run(pluck=True)
+	):
+		(
+			frappe.qb.update(IntegrationRequest)
+			.set(IntegrationRequest.capture_claimed_by, claimed_by)
+			.set(IntegrationRequest.capture_claim_expires_on, add_to_date(now, seconds=CAPTURE_LEASE))
+			.where(claimable & IntegrationRequest.name.isin(candidates))
+			.run()
+		)
+		frappe.db.commit()
+
+		claimed = frappe.get_all(
+			"Integration Request",
+			filters={"name": ("in", candidates), "capture_claimed_by": claimed_by},
+			fields=["name", "creation", "data"],
+		)
+		if claimed:
+			return claimed
+
+	return []
+
+
+def use_sandbox(data):
+	return bool(cint(data.get("notes", {}).get("use_sandbox")) or data.get("use_sandbox"))
+
+
+def capture_razorpay_payment(session, auth, payment_id, amount):
+	"""Capture a single payment if Razorpay still reports it as authorized"""
+	resp = session.get(f"https://api.razorpay.com/v1/payments/{payment_id}", auth=auth)
+	resp.raise_for_status()
+	payment = resp.json()
+
+	if payment.get("status") == "authorized":
+		payment = post_razorpay_capture(session, auth, payment_id, amount)
+
+	return payment
+
+
+def create_razorpay_addon(session, url, auth, addon):
+	"""Create one subscription add-on"""
+	resp = session.post(url, auth=auth, json=addon)
+	resp.raise_for_status()
+	return resp.json()
+
+
+def post_razorpay_capture(session, auth, payment_id, amount):
+	resp = session.post(
+		f"https://api.razorpay.com/v1/payments/{payment_id}/capture",
+		auth=auth,
+		data={"amount": amount},
+	)
+	resp.raise_for_status()
+	return resp.json()
+
+
+def reconcile_razorpay_payments(session, jobs, from_timestamp, max_workers=CAPTURE_WORKERS):
+	"""Capture `(auth, payment_id, amount)` jobs using one listing of payments per account.
+
+	Only payments the listing reports as authorized get a capture call. The listing stops
+	once it has found every payment or would take more calls than fetching them one by one,
+	the payments it missed are then looked up individually.
+	Returns `(payment, exception)` tuples in the order of `jobs`.
+	"""
+	to_timestamp = int(time.time())
+	payments = {}
+	payment_ids_by_auth = {}
+	for auth, payment_id, _amount in jobs:
+		payment_ids_by_auth.setdefault(auth, set()).add(payment_id)
+
+	for auth, payment_ids in payment_ids_by_auth.items():
+		pending = set(payment_ids)
+		try:
+			for payment in list_razorpay_payments(
+				session, auth, from_timestamp, to_timestamp, max_pages=len(payment_ids)
+			):
+				if payment["id"] in pending:
+					payments[payment["id"]] = payment
+					pending.discard(payment["id"])
+					if not pending:
+						break
 		except Exception:
-			doc = frappe.get_doc("Integration Request", doc.name)
-			doc.status = "Failed"
-			doc.error = frappe.get_traceback()
-			doc.save()
-			frappe.log_error(doc.error, f"{doc.name} Failed")
+			frappe.log_error(title="Razorpay payments listing failed")
+
+	def reconcile(job):
+		auth, payment_id, amount = job
+		payment = payments.get(payment_id)
+		if payment is None:
+			return capture_razorpay_payment(session, auth, payment_id, amount)
+		if payment.get("status") == "authorized":
+			return post_razorpay_capture(session, auth, payment_id, amount)
+		return payment
+
+	return map_concurrently(reconcile, jobs, max_workers)
+
+
+def list_razorpay_payments(session, auth, from_timestamp, to_timestamp, max_pages=None):
+	"""Yield the payments created between the two unix timestamps, a page at a time"""
+	skip = pages = 0
+	while not max_pages or pages < max_pages:
+		pages += 1
+		resp = session.get(
+			"https://api.razorpay.com/v1/payments",
+			auth=auth,
+			params={"from": from_timestamp, "to": to_timestamp, "count": PAYMENTS_PAGE_SIZE, "skip": skip},
+		)
+		resp.raise_for_status()
+		items = resp.json().get("items") or []
+		yield from items
+
+		if len(items) < PAYMENTS_PAGE_SIZE:
+			return
+		skip += PAYMENTS_PAGE_SIZE
+
+
+def update_captured_requests(integration_requests, results):
+	completed = []
+
+	for doc, (resp, error) in zip(integration_requests, results, strict=True):
+		if error:
+			traceback = "".join(format_exception(error))
+			frappe.db.set_value("Integration Request", doc.name, {"status": "Failed", "error": traceback})
+			frappe.log_error(traceback, f"{doc.name} Failed")
+
+		elif resp and resp.get("status") == "captured":
+			completed.append(doc.name)
+
+	if completed:
+		frappe.db.set_value("Integration Request", {"name": ("in", completed)}, "status", "Completed")
 
 
 @frappe.whitelist(allow_guest=True)
@@ -625,27 +881,25 @@ def razorpay_subscription_callback():
 	try:
 		data = frappe.local.form_dict
 
-		validate_payment_callback(data)
+		verify_webhook(data)
 
 		data.update({"payment_gateway": "Razorpay"})
 
-		doc = frappe.get_doc(
-			{
-				"data": json.dumps(frappe.local.form_dict),
-				"doctype": "Integration Request",
-				"request_description": "Subscription Notification",
-				"is_remote_request": 1,
-				"status": "Queued",
-			}
-		).insert(ignore_permissions=True)
-		frappe.db.commit()
+		# retried deliveries of a webhook carry the same event id
+		name = record_webhook_event(
+			"Razorpay",
+			frappe.get_request_header("X-Razorpay-Event-Id"),
+			data,
+			request_description="Subscription Notification",
+		)
+		if not name:
+			return
 
-		frappe.enqueue(
-			method="payments.payment_gateways.doctype.razorpay_settings.razorpay_settings.handle_subscription_notification",
+		enqueue_webhook_event(
+			name,
+			"payments.payment_gateways.doctype.razorpay_settings.razorpay_settings.handle_subscription_notification",
 			queue="long",
 			timeout=600,
-			is_async=True,
-			**{"doctype": "Integration Request", "docname": doc.name},
 		)
 
 	except frappe.InvalidStatusError:
@@ -654,6 +908,44 @@ def razorpay_subscription_callback():
 		frappe.log(frappe.log_error(title=e))
 
 
+def verify_webhook(data):
+	"""Verify the webhook's `X-Razorpay-Signature` with the webhook secret, and that the
+	subscription is active as of the signed payload.
+
+	Falls back to fetching the subscription from Razorpay when no webhook secret is set
+	or Razorpay Settings ask for remote verification.
+	"""
+	webhook_settings = get_webhook_settings()
+	if webhook_settings.verify_remotely or not webhook_settings.secret:
+		validate_payment_callback(data)
+		return
+
+	signature = frappe.get_request_header("X-Razorpay-Signature")
+	if not signature:
+		frappe.throw(_("Missing Razorpay Signature"), exc=frappe.PermissionError)
+
+	frappe.get_cached_doc("Razorpay Settings").verify_signature(
+		frappe.request.get_data(as_text=True), signature, webhook_settings.secret
+	)
+
+	subscription = ((data.get("payload") or {}).get("subscription") or {}).get("entity") or {}
+	if subscription.get("status") != "active":
+		frappe.throw(_("Invalid Subscription"), exc=frappe.InvalidStatusError)
+
+
+def get_webhook_settings():
+	"""Return the webhook secret and verification mode, cached until Razorpay Settings are saved"""
+
+	def _get_webhook_settings():
+		settings = frappe.get_doc("Razorpay Settings")
+		return {
+			"secret": settings.get_password(fieldname="webhook_secret", raise_exception=False),
+			"verify_remotely": cint(settings.verify_webhooks_remotely),
+		}
+
+	return frappe._dict(frappe.cache().get_value(WEBHOOK_SETTINGS_CACHE_KEY, _get_webhook_settings))
+
+
 def validate_payment_callback(data):
 	def _throw():
 		frappe.throw(_("Invalid Subscription"), exc=frappe.InvalidStatusError)
@@ -0,0 +1,253 @@
+# Copyright (c) 2025, Frappe Technologies and Contributors
+# See license.txt
+
+import hashlib
+import hmac
+import json
+import threading
+from unittest.mock import patch
+
+import frappe
+from frappe.integrations.utils import create_request_log
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_to_date, now_datetime
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from payments.payment_gateways.doctype.razorpay_settings import razorpay_settings
+from payments.payment_gateways.doctype.razorpay_settings.razorpay_settings import (
+	capture_claimed_payments,
+	claim_authorized_requests,
+	list_razorpay_payments,
+	reconcile_razorpay_payments,
+	verify_webhook,
+)
+
+WEBHOOK_SECRET = "test-webhook-secret"
+
+
+class TestRazorpaySettings(FrappeTestCase):
+	# claims commit their lease, so requests are committed and removed by hand
+	def setUp(self):
+		self.integration_requests = [
+			create_request_log(
+				{"razorpay_payment_id": f"pay_{frappe.generate_hash(length=14)}", "amount": 10000},
+				service_name="Razorpay",
+				status="Authorized",
+			).name
+			for _i in range(3)
+		]
+		frappe.db.commit()
+
+	def tearDown(self):
+		frappe.db.rollback()
+		frappe.db.delete("Integration Request", {"name": ("in", self.integration_requests)})
+		frappe.db.commit()
+
+	def claim(self, claimed_by, limit=10, names=None):
+		return {
+			doc.name
+			for doc in claim_authorized_requests(claimed_by, limit, names or self.integration_requests)
+		}
+
+	def test_claimers_never_share_requests(self):
+		first = self.claim("claimer-1", limit=2)
+		second = self.claim("claimer-2", limit=2)
+
+		self.assertEqual(len(first), 2)
+		self.assertEqual(first | second, set(self.integration_requests))
+		self.assertFalse(first & second)
+		# every request is leased, a third claimer finds nothing
+		self.assertFalse(self.claim("claimer-3"))
+
+	def test_expired_lease_is_reclaimed(self):
+		self.assertEqual(self.claim("claimer-1"), set(self.integration_requests))
+
+		expired = self.integration_requests[0]
+		frappe.db.set_value(
+			"Integration Request",
+			expired,
+			"capture_claim_expires_on",
+			add_to_date(now_datetime(), seconds=-1),
+		)
+
+		self.assertEqual(self.claim("claimer-2"), {expired})
+		self.assertEqual(
+			frappe.db.get_value("Integration Request", expired, "capture_claimed_by"), "claimer-2"
+		)
+
+	def test_claim_is_restricted_to_names(self):
+		names = self.integration_requests[:1]
+
+		self.assertEqual(self.claim("claimer-1", names=names), set(names))
+		self.assertEqual(self.claim("claimer-2"), set(self.integration_requests[1:]))
+
+	def test_sandbox_capture_completes_requests(self):
+		capture_claimed_payments(
+			is_sandbox=True, sanbox_response={"status": "captured"}, names=self.integration_requests
+		)
+
+		self.assertEqual(
+			frappe.get_all(
+				"Integration Request",
+				{"name": ("in", self.integration_requests)},
+				pluck="status",
+				distinct=True,
+			),
+			["Completed"],
+		)
+
+
+class TestRazorpayWebhooks(FrappeTestCase):
+	def setUp(self):
+		patcher = patch.object(
+			razorpay_settings,
+			"get_webhook_settings",
+			return_value=frappe._dict(secret=WEBHOOK_SECRET, verify_remotely=0),
+		)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.addCleanup(setattr, frappe.local, "request", getattr(frappe.local, "request", None))
+
+	def verify(self, data, body=None, signature=None):
+		body = body or json.dumps(data)
+		headers = {}
+		if signature is not False:
+			headers["X-Razorpay-Signature"] = signature or sign(body)
+
+		frappe.local.request = Request(
+			EnvironBuilder(method="POST", data=body, headers=headers).get_environ()
+		)
+		verify_webhook(frappe._dict(data))
+
+	def test_valid_signature(self):
+		self.verify(make_subscription_event("active"))
+
+	def test_tampered_body(self):
+		data = make_subscription_event("active")
+		signature = sign(json.dumps(data))
+		data["payload"]["subscription"]["entity"]["id"] = "sub_other"
+
+		with self.assertRaises(frappe.PermissionError):
+			self.verify(data, signature=signature)
+
+	def test_missing_signature(self):
+		with self.assertRaises(frappe.PermissionError):
+			self.verify(make_subscription_event("active"), signature=False)
+
+	def test_inactive_subscription(self):
+		for status in ("halted", "cancelled"):
+			with self.subTest(status), self.assertRaises(frappe.InvalidStatusError):
+				self.verify(make_subscription_event(status))
+
+
+class TestRazorpayReconciliation(FrappeTestCase):
+	def setUp(self):
+		patcher = patch.object(razorpay_settings, "PAYMENTS_PAGE_SIZE", 2)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_listing_stops_once_all_payments_are_found(self):
+		session = FakeSession(
+			[("pay_0", "authorized"), ("pay_1", "captured"), ("pay_2", "authorized"), ("pay_3", "failed")]
+			+ [(f"pay_{i}", "captured") for i in range(4, 10)]
+		)
+		jobs = [(AUTH, payment_id, 100) for payment_id in ("pay_2", "pay_0", "pay_1")]
+
+		results = reconcile_razorpay_payments(session, jobs, from_timestamp=0)
+
+		self.assertEqual(
+			[(payment["id"], payment["status"], error) for payment, error in results],
+			[("pay_2", "captured", None), ("pay_0", "captured", None), ("pay_1", "captured", None)],
+		)
+		# two pages hold all three payments, only the authorized ones get a capture call
+		self.assertEqual(session.count("list"), 2)
+		self.assertEqual(session.count("fetch"), 0)
+		self.assertEqual(sorted(session.captured), ["pay_0", "pay_2"])
+
+	def test_listing_is_capped(self):
+		session = FakeSession([(f"pay_{i}", "captured") for i in range(10)])
+
+		payments = list(list_razorpay_payments(session, AUTH, 0, 1, max_pages=3))
+
+		self.assertEqual(len(payments), 6)
+		self.assertEqual(session.count("list"), 3)
+
+	def test_payments_beyond_the_cap_are_fetched(self):
+		session = FakeSession([(f"pay_{i}", "captured") for i in range(10)] + [("pay_late", "authorized")])
+
+		# one job allows a single page, which does not hold the payment
+		results = reconcile_razorpay_payments(session, [(AUTH, "pay_late", 100)], from_timestamp=0)
+
+		self.assertEqual(results[0][0]["status"], "captured")
+		self.assertEqual(session.count("list"), 1)
+		self.assertEqual(session.count("fetch"), 1)
+		self.assertEqual(session.captured, ["pay_late"])
+
+	def test_failed_listing_falls_back_to_fetching(self):
+		session = FakeSession([("pay_0", "authorized"), ("pay_1", "captured")], fail_listing=True)
+		jobs = [(AUTH, "pay_0", 100), (AUTH, "pay_1", 100)]
+
+		results = reconcile_razorpay_payments(session, jobs, from_timestamp=0)
+
+		self.assertEqual([payment["status"] for payment, _error in results], ["captured", "captured"])
+		self.assertEqual(session.count("fetch"), 2)
+		self.assertEqual(session.captured, ["pay_0"])
+
+
+AUTH = ("rzp_test_key", "rzp_test_secret")
+
+
+class FakeResponse:
+	def __init__(self, payload):
+		self.payload = payload
+
+	def raise_for_status(self):
+		pass
+
+	def json(self):
+		return self.payload
+
+
+class FakeSession:
+	"""Stands in for the pooled session, serving payments in listing order"""
+
+	def __init__(self, payments, fail_listing=False):
+		self.payments = [{"id": payment_id, "status": status} for payment_id, status in payments]
+		self.fail_listing = fail_listing
+		self.calls, self.captured = [], []
+		self.lock = threading.Lock()
+
+	def count(self, call):
+		return self.calls.count(call)
+
+	def get(self, url, auth=None, params=None):
+		payment_id = url.rsplit("/", 1)[-1]
+		with self.lock:
+			self.calls.append("list" if payment_id == "payments" else "fetch")
+
+		if payment_id == "payments":
+			if self.fail_listing:
+				raise ConnectionError("listing failed")
+			return FakeResponse(
+				{"items": [dict(payment) for payment in self.payments[params["skip"] :][: params["count"]]]}
+			)
+
+		return FakeResponse(dict(next(payment for payment in self.payments if payment["id"] == payment_id)))
+
+	def post(self, url, auth=None, data=None):
+		payment_id = url.rsplit("/", 2)[-2]
+		with self.lock:
+			self.captured.append(payment_id)
+		return FakeResponse({"id": payment_id, "status": "captured", "amount": data["amount"]})
+
+
+def make_subscription_event(status):
+	return {
+		"event": "subscription.charged",
+		"payload": {"subscription": {"entity": {"id": "sub_test", "status": status}}},
+	}
+
+
+def sign(body):
+	return hmac.new(WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
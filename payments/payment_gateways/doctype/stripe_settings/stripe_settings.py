@@ -6,11 +6,11 @@ from urllib.parse import urlencode
 
 import frappe
 from frappe import _
-from frappe.integrations.utils import create_request_log, make_get_request
+from frappe.integrations.utils import create_request_log
 from frappe.model.document import Document
 from frappe.utils import call_hook_method, cint, flt, get_url
 
-from payments.utils import create_payment_gateway
+from payments.utils import create_payment_gateway, get_session, make_get_request
 
 currency_wise_minimum_charge_amount = {
 	"JPY": 50,
@@ -198,7 +198,9 @@ class StripeSettings(Document):
 
 		self.data = frappe._dict(data)
 		stripe.api_key = self.get_password(fieldname="secret_key", raise_exception=False)
-		stripe.default_http_client = stripe.http_client.RequestsClient()
+		stripe.default_http_client = stripe.http_client.RequestsClient(
+			session=get_session("https://api.stripe.com")
+		)
 
 		try:
 			self.integration_request = create_request_log(self.data, service_name="Stripe")
@@ -279,6 +281,5 @@ class StripeSettings(Document):
 
 def get_gateway_controller(doctype, docname, payment_gateway=None):
 	if not payment_gateway:
-		reference_doc = frappe.get_doc(doctype, docname)
-		payment_gateway = reference_doc.payment_gateway
-	return frappe.db.get_value("Payment Gateway", payment_gateway, "gateway_controller")
+		payment_gateway = frappe.db.get_value(doctype, docname, "payment_gateway")
+	return frappe.get_cached_value("Payment Gateway", payment_gateway, "gateway_controller")
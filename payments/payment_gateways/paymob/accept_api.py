@@ -13,7 +13,7 @@ from .response_feedback_dataclass import ResponseFeedBack
 class AcceptAPI:
 	def __init__(self) -> None:
 		"""Class for Accept APIs
-		By Initializing an Instance from This class, an auth token is obtained automatically
+		The shared auth token is obtained automatically when a request needs it
 		and You will be able to call The Following APIs:
 		- Create Payment Intention
 		- Get Transaction Details
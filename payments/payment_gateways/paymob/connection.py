@@ -1,9 +1,10 @@
 from typing import Any
 
-import requests
 from frappe.utils.password import get_decrypted_password
 from requests import HTTPError, JSONDecodeError, RequestException
 
+from payments.utils import get_cached_token, get_session
+
 from .paymob_urls import PaymobUrls
 from .response_codes import (
 	HTTP_EXCEPTION,
@@ -19,19 +20,30 @@ from .response_codes import (
 )
 from .response_feedback_dataclass import ResponseFeedBack
 
+AUTH_TOKEN_CACHE_KEY = "paymob_auth_token"
+# auth tokens are valid for one hour from creation
+AUTH_TOKEN_LIFETIME = 60 * 60
+
 
 class AcceptConnection:
 	def __init__(self) -> None:
 		"""Initializing the Following:
-		1- Requests Session
-		2- Auth Token
-		3- Set Headers
-		4- Paymob Urls
+		1- Shared Requests Session
+		2- Paymob Urls
+
+		The auth token is shared by all workers through the cache and only
+		fetched once a request actually needs it.
 		"""
-		self.session = requests.Session()
 		self.paymob_urls = PaymobUrls()
-		self.auth_token = self._get_auth_token()
-		self.session.headers.update(self._get_headers())
+		self.session = get_session(self.paymob_urls.base_url)
+
+	@property
+	def auth_token(self) -> str | None:
+		return get_cached_token(AUTH_TOKEN_CACHE_KEY, self.generate_auth_token, refresh_ahead=120)
+
+	@property
+	def headers(self) -> dict[str, Any]:
+		return self._get_headers()
 
 	def _get_headers(self) -> dict[str, Any]:
 		"""Initialize Header for Requests
@@ -44,11 +56,11 @@ class AcceptConnection:
 			"Authorization": f"{self.auth_token}",
 		}
 
-	def _get_auth_token(self) -> str | None:
-		"""Retrieve an Auth Token
+	def generate_auth_token(self) -> tuple[str | None, int]:
+		"""Request a new Auth Token from Paymob
 
 		Returns:
-		        Union[str, None]: Auth Token
+		        Tuple[Union[str, None], int]: (Auth Token, lifetime in seconds)
 		"""
 		api_key = get_decrypted_password("Paymob Settings", "Paymob Settings", "api_key")
 		request_body = {"api_key": api_key}
@@ -56,33 +68,41 @@ class AcceptConnection:
 		code, feedback = self.post(
 			url=self.paymob_urls.get_url("auth"),
 			json=request_body,
+			authenticated=False,
 		)
 
-		token = None
-		if code == SUCCESS:
-			token = feedback.data.get("token")
-		return token
+		if code != SUCCESS or not feedback.data.get("token"):
+			raise feedback.exception_error or RequestException(feedback.message)
+
+		return feedback.data.get("token"), AUTH_TOKEN_LIFETIME
 
-	def _process_request(self, call, *args, **kwargs) -> tuple[str, dict[str, Any], ResponseFeedBack]:
+	def _process_request(
+		self, call, *args, authenticated=True, **kwargs
+	) -> tuple[str, dict[str, Any], ResponseFeedBack]:
 		"""Process the Request
 
 		Args:
 		        call (Session.get/Session.post): Session.get/Session.post
 		        *args, **kwargs: Same Args of requests.post/requests.get methods
+		        authenticated (bool): Send the Auth Token with the request
 
 		Returns:
 		        Tuple[str, Dict[str, Any], ResponseFeedBack]: Tuple containes the Following (Code, Data, Success/Error Message)
 		"""
 
-		reponse_data = None
+		reponse_data = response = None
 		try:
+			# the session is shared across connections, so headers are sent per request, and a
+			# failed token request is reported like a failure of the request itself
+			headers = self.headers if authenticated else {"Content-Type": "application/json"}
+			kwargs["headers"] = {**headers, **(kwargs.get("headers") or {})}
 			response = call(*args, timeout=90, **kwargs)
 			reponse_data = response.json()
 			response.raise_for_status()
 		except JSONDecodeError as error:
 			reponse_feedback = ResponseFeedBack(
 				message=JSON_DECODE_EXCEPTION_MESSAGE,
-				status_code=response.status_code,
+				status_code=getattr(response, "status_code", None),
 				exception_error=error,
 			)
 			return JSON_DECODE_EXCEPTION, reponse_feedback
@@ -90,7 +110,7 @@ class AcceptConnection:
 			reponse_feedback = ResponseFeedBack(
 				message=HTTP_EXCEPTION_MESSAGE,
 				data=reponse_data,
-				status_code=response.status_code,
+				status_code=getattr(response, "status_code", None),
 				exception_error=error,
 			)
 			return HTTP_EXCEPTION, reponse_feedback
@@ -1,145 +1,147 @@
 import hashlib
 import hmac
+from collections.abc import Callable
 from typing import Any
 
 import frappe
+from frappe.utils.password import get_decrypted_password
 
 from .constants import AcceptCallbackTypes
 
+HMAC_SECRET_CACHE_KEY = "paymob_hmac_secret"
+
+_keyed_hmacs = {}
+
+
+def _compile_fields(*fields: str) -> tuple[Callable[[dict], Any], ...]:
+	"""Turn dotted field names into getters once, so callbacks only run the lookups"""
+	return tuple(_make_getter(*field.split(".")) for field in fields)
+
+
+def _make_getter(key: str, *nested_keys: str) -> Callable[[dict], Any]:
+	if not nested_keys:
+		return lambda obj: obj.get(key)
+
+	nested_getter = _make_getter(*nested_keys)
+
+	def getter(obj):
+		value = obj.get(key)
+		return nested_getter(value) if isinstance(value, dict) else None
+
+	return getter
+
+
+# Fields concatenated, in this order, into the HMAC message of each callback type
+HMAC_FIELDS = {
+	AcceptCallbackTypes.TRANSACTION: _compile_fields(
+		"amount_cents",
+		"created_at",
+		"currency",
+		"error_occured",
+		"has_parent_transaction",
+		"id",
+		"integration_id",
+		"is_3d_secure",
+		"is_auth",
+		"is_capture",
+		"is_refunded",
+		"is_standalone_payment",
+		"is_voided",
+		"order.id",
+		"owner",
+		"pending",
+		"source_data.pan",
+		"source_data.sub_type",
+		"source_data.type",
+		"success",
+	),
+	AcceptCallbackTypes.CARD_TOKEN: _compile_fields(
+		"card_subtype",
+		"created_at",
+		"email",
+		"id",
+		"masked_pan",
+		"merchant_id",
+		"order_id",
+		"token",
+	),
+	AcceptCallbackTypes.DELIVERY_STATUS: _compile_fields(
+		"order_id",
+		"order_delivery_status",
+		"merchant_id",
+		"merchant_name",
+		"updated_at",
+	),
+}
+
+
+def get_hmac_secret() -> bytes:
+	"""Return the HMAC secret of Paymob Settings, cached until the settings are saved"""
+	return (
+		frappe.cache()
+		.get_value(
+			HMAC_SECRET_CACHE_KEY,
+			lambda: get_decrypted_password("Paymob Settings", "Paymob Settings", "hmac"),
+		)
+		.encode("utf-8")
+	)
 
-class HMACValidator:
-	def __init__(self, incoming_hmac: str, callback_dict: dict[str, Any], **kwargs) -> None:
-		"""Initialize HMAC Attributes
-
-		Args:
-		        incoming_hmac (str): Incoming Paymob's HMAC
-		        callback_dict Dict[str, Any]: Incoming Callback Dict
-		"""
-		self.incoming_hmac = incoming_hmac
-		self.callback_dict = callback_dict
-		if isinstance(self.callback_dict, dict):
-			self.callback_obj_dict = self.callback_dict.get("obj")
-
-		super().__init__(**kwargs)
 
-	@staticmethod
-	def _calculate_hmac(message: str) -> str:
-		"""Calculates HMAC
+def clear_hmac_secret_cache():
+	frappe.cache().delete_value(HMAC_SECRET_CACHE_KEY)
+	_keyed_hmacs.clear()
 
-		Args:
-		        message (str): GeneratedHMAC Message
 
-		Returns:
-		        str: Calculated HMAC
-		"""
-		hmac_secret = frappe.get_doc("Paymob Settings").get_password("hmac").encode("utf-8")
-		return (
-			hmac.new(
-				hmac_secret,
-				message.encode("utf-8"),
-				hashlib.sha512,
-			)
-			.hexdigest()
-			.lower()
-		)
-
-	@classmethod
-	def _generate_processed_hmac(cls, hmac_dict: dict[str, Any]) -> str:
-		"""Creates HMAC from sent self.callback_obj_dict
-
-		Args:
-		        hmac_dict (Dict[str, Any]): Hmac Dict
+def build_hmac_message(fields: tuple[Callable[[dict], Any], ...], obj: dict[str, Any]) -> str:
+	"""Concatenate the values of `fields` in `obj` into the HMAC message
 
-		Returns:
-		        str: Generated HMAC
-		"""
-		if not isinstance(hmac_dict, dict):
-			return ""
+	Args:
+	        fields (Tuple[Callable, ...]): Field getters from `HMAC_FIELDS`
+	        obj (Dict[str, Any]): Callback `obj` dict
 
-		message = ""
-		for value in hmac_dict.values():
-			if isinstance(value, bool):
-				value = str(value).lower()
-			if value is None:
-				value = ""
-			message += str(value)
+	Returns:
+	        str: HMAC message
+	"""
+	return "".join(
+		"" if value is None else "true" if value is True else "false" if value is False else str(value)
+		for value in (get(obj) for get in fields)
+	)
 
-		return cls._calculate_hmac(message=message)
 
-	def _generate_transaction_processed_hmac(self) -> str:
-		"""Creates HMAC from sent transaction callback self.callback_obj_dict
+def calculate_hmac(secret: bytes, message: str) -> str:
+	"""Calculates HMAC
 
-		Returns:
-		        str: Generated HMAC
-		"""
-		if not isinstance(self.callback_obj_dict, dict):
-			return ""
-
-		hmac_dict = {
-			"amount_cents": self.callback_obj_dict.get("amount_cents"),
-			"created_at": self.callback_obj_dict.get("created_at"),
-			"currency": self.callback_obj_dict.get("currency"),
-			"error_occured": self.callback_obj_dict.get("error_occured"),
-			"has_parent_transaction": self.callback_obj_dict.get("has_parent_transaction"),
-			"id": self.callback_obj_dict.get("id"),
-			"integration_id": self.callback_obj_dict.get("integration_id"),
-			"is_3d_secure": self.callback_obj_dict.get("is_3d_secure"),
-			"is_auth": self.callback_obj_dict.get("is_auth"),
-			"is_capture": self.callback_obj_dict.get("is_capture"),
-			"is_refunded": self.callback_obj_dict.get("is_refunded"),
-			"is_standalone_payment": self.callback_obj_dict.get("is_standalone_payment"),
-			"is_voided": self.callback_obj_dict.get("is_voided"),
-			"order.id": self.callback_obj_dict.get("order", {}).get("id"),
-			"owner": self.callback_obj_dict.get("owner"),
-			"pending": self.callback_obj_dict.get("pending"),
-			"source_data.pan": self.callback_obj_dict.get("source_data", {}).get("pan"),
-			"source_data.sub_type": self.callback_obj_dict.get("source_data", {}).get("sub_type"),
-			"source_data.type": self.callback_obj_dict.get("source_data", {}).get("type"),
-			"success": self.callback_obj_dict.get("success"),
-		}
-
-		return self._generate_processed_hmac(hmac_dict=hmac_dict)
-
-	def _generate_card_token_processed_hmac(self) -> str:
-		"""Creates HMAC from sent card token callback body_dic
+	Args:
+	        secret (bytes): Paymob HMAC secret
+	        message (str): GeneratedHMAC Message
 
-		Returns:
-		        str: Generated HMAC
-		"""
-		if not isinstance(self.callback_obj_dict, dict):
-			return ""
+	Returns:
+	        str: Calculated HMAC
+	"""
+	# keying the HMAC hashes the secret, do that once per secret and copy the state
+	if (keyed := _keyed_hmacs.get(secret)) is None:
+		keyed = _keyed_hmacs[secret] = hmac.new(secret, digestmod=hashlib.sha512)
 
-		hmac_dict = {
-			"card_subtype": self.callback_obj_dict.get("card_subtype"),
-			"created_at": self.callback_obj_dict.get("created_at"),
-			"email": self.callback_obj_dict.get("email"),
-			"id": self.callback_obj_dict.get("id"),
-			"masked_pan": self.callback_obj_dict.get("masked_pan"),
-			"merchant_id": self.callback_obj_dict.get("merchant_id"),
-			"order_id": self.callback_obj_dict.get("order_id"),
-			"token": self.callback_obj_dict.get("token"),
-		}
+	calculated = keyed.copy()
+	calculated.update(message.encode("utf-8"))
+	return calculated.hexdigest()
 
-		return self._generate_processed_hmac(hmac_dict=hmac_dict)
 
-	def _generate_delivery_status_processed_hmac(self) -> str:
-		"""Creates HMAC from sent Delivery Status callback body_dic
+class HMACValidator:
+	def __init__(self, incoming_hmac: str, callback_dict: dict[str, Any], **kwargs) -> None:
+		"""Initialize HMAC Attributes
 
-		Returns:
-		        str: Generated HMAC
+		Args:
+		        incoming_hmac (str): Incoming Paymob's HMAC
+		        callback_dict Dict[str, Any]: Incoming Callback Dict
 		"""
-		if not isinstance(self.callback_obj_dict, dict):
-			return ""
-
-		hmac_dict = {
-			"order_id": self.callback_obj_dict.get("order_id"),
-			"order_delivery_status": self.callback_obj_dict.get("order_delivery_status"),
-			"merchant_id": self.callback_obj_dict.get("merchant_id"),
-			"merchant_name": self.callback_obj_dict.get("merchant_name"),
-			"updated_at": self.callback_obj_dict.get("updated_at"),
-		}
+		self.incoming_hmac = incoming_hmac
+		self.callback_dict = callback_dict
+		self.callback_obj_dict = None
+		if isinstance(self.callback_dict, dict):
+			self.callback_obj_dict = self.callback_dict.get("obj")
 
-		return self._generate_processed_hmac(hmac_dict=hmac_dict)
+		super().__init__(**kwargs)
 
 	# Public Method that can be used Directly to Validate HMAC
 	@property
@@ -149,20 +151,14 @@ class HMACValidator:
 		Returns:
 		        bool: True if HMAC is Valid, False otherwise
 		"""
-		if not isinstance(self.callback_dict, dict):
+		if not isinstance(self.callback_dict, dict) or not isinstance(self.callback_obj_dict, dict):
 			return False
 
-		callback_type = self.callback_dict.get("type")
-		if callback_type == AcceptCallbackTypes.TRANSACTION:
-			calculated_hmac = self._generate_transaction_processed_hmac()
-		elif callback_type == AcceptCallbackTypes.CARD_TOKEN:
-			calculated_hmac = self._generate_card_token_processed_hmac()
-		elif callback_type == AcceptCallbackTypes.DELIVERY_STATUS:
-			calculated_hmac = self._generate_delivery_status_processed_hmac()
-		else:
+		fields = HMAC_FIELDS.get(self.callback_dict.get("type"))
+		if not fields or not self.incoming_hmac:
 			return False
 
-		if calculated_hmac != self.incoming_hmac:
-			return False
-
-		return True
+		calculated_hmac = calculate_hmac(
+			get_hmac_secret(), build_hmac_message(fields, self.callback_obj_dict)
+		)
+		return hmac.compare_digest(calculated_hmac, str(self.incoming_hmac).lower())
@@ -6,6 +6,8 @@ import stripe
 from frappe import _
 from frappe.integrations.utils import create_request_log
 
+from payments.utils import get_session
+
 
 def create_stripe_subscription(gateway_controller, data):
     stripe_settings = frappe.get_doc("Stripe Settings", gateway_controller)
@@ -13,7 +15,9 @@ def create_stripe_subscription(gateway_controller, data):
 
     stripe.api_key = stripe_settings.get_password(
         fieldname="secret_key", raise_exception=False)
-    stripe.default_http_client = stripe.http_client.RequestsClient()
+    stripe.default_http_client = stripe.http_client.RequestsClient(
+        session=get_session("https://api.stripe.com")
+    )
 
     try:
         stripe_settings.integration_request = create_request_log(
@@ -0,0 +1,339 @@
+"""
+Load harness that drives full checkouts against `payments.simulator.server`.
+
+Each iteration runs the path a real payment takes with Razorpay, Paymob, Mpesa, Paytm or
+PayPal: `get_payment_url` (the STK pushes for Mpesa), then the provider callbacks, which
+end in `on_payment_authorized` when a reference document is given, and for Razorpay the
+capture. The capture runs in this process rather than on a background worker, as the
+simulator override only applies to this process. Phase latencies and throughput are
+reported so regressions show up without network access:
+
+    bench --site test.localhost execute payments.simulator.load.run --kwargs "{'gateway': 'Paymob', 'iterations': 200}"
+
+The gateway settings must hold (any) credentials; Mpesa uses the first Mpesa Settings
+record and Paytm only completes payments of a reference document. Every iteration leaves its Integration
+Requests behind like a real checkout, so run it against a test site. Iterations run one
+after the other as Frappe's site context is per thread; run the harness from several
+processes to add concurrency.
+"""
+
+import math
+import time
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+import frappe
+from frappe import _
+
+from payments.simulator.server import SIMULATED_HOSTS, ProviderSimulator
+from payments.utils.http import reset_sessions
+
+
+def razorpay_checkout(payment):
+	from payments.payment_gateways.doctype.razorpay_settings import razorpay_settings
+
+	settings = frappe.get_doc("Razorpay Settings")
+
+	started = time.perf_counter()
+	url = settings.get_payment_url(**payment)
+	payment_url_time = time.perf_counter() - started
+
+	# background workers do not see the simulator override, capture here instead of enqueuing
+	captures = []
+	with patch.object(razorpay_settings, "enqueue_capture", side_effect=captures.append):
+		started = time.perf_counter()
+		result = settings.create_request(
+			{
+				"token": parse_qs(urlsplit(url).query)["token"][0],
+				"razorpay_payment_id": f"pay_{frappe.generate_hash(length=14)}",
+				"reference_doctype": payment.get("reference_doctype"),
+				"reference_docname": payment.get("reference_docname"),
+			}
+		)
+		callback_time = time.perf_counter() - started
+
+	if not str(result.get("redirect_to")).startswith("payment-success"):
+		raise Exception(f"Payment not authorized: {result}")
+
+	started = time.perf_counter()
+	razorpay_settings.capture_claimed_payments(names=captures)
+	capture_time = time.perf_counter() - started
+
+	assert_completed(captures)
+	return {"get_payment_url": payment_url_time, "callback": callback_time, "capture": capture_time}
+
+
+def paymob_checkout(payment):
+	from payments.payment_gateways.doctype.paymob_settings.paymob_settings import handle_callback
+	from payments.payment_gateways.paymob.constants import AcceptCallbackTypes
+	from payments.payment_gateways.paymob.hmac_validator import (
+		HMAC_FIELDS,
+		HMACValidator,
+		build_hmac_message,
+		calculate_hmac,
+		get_hmac_secret,
+	)
+
+	settings = frappe.get_doc("Paymob Settings")
+
+	started = time.perf_counter()
+	order = settings.create_order(redirect_to=None, **payment)
+	settings.get_payment_url(order_id=order["id"], **payment)
+	payment_url_time = time.perf_counter() - started
+
+	callback = {
+		"type": AcceptCallbackTypes.TRANSACTION,
+		"obj": {
+			"id": int(frappe.generate_hash(length=9), 16),
+			"amount_cents": int(payment["amount"] * 100),
+			"created_at": frappe.utils.now(),
+			"currency": payment["currency"],
+			"success": True,
+			"pending": False,
+			"is_auth": False,
+			"is_capture": False,
+			"order": {"id": order["id"], "payment_status": "PAID"},
+			"data": {"txn_response_code": "APPROVED", "migs_order": {"status": "CAPTURED"}},
+		},
+	}
+	incoming_hmac = calculate_hmac(
+		get_hmac_secret(), build_hmac_message(HMAC_FIELDS[AcceptCallbackTypes.TRANSACTION], callback["obj"])
+	)
+
+	started = time.perf_counter()
+	if not HMACValidator(incoming_hmac=incoming_hmac, callback_dict=callback).is_valid:
+		raise Exception("Invalid HMAC")
+	handle_callback(callback)
+	callback_time = time.perf_counter() - started
+
+	return {"get_payment_url": payment_url_time, "callback": callback_time}
+
+
+def mpesa_checkout(payment):
+	from payments.payment_gateways.doctype.mpesa_settings.mpesa_settings import verify_transaction
+
+	if not (gateway := frappe.get_all("Mpesa Settings", pluck="name", limit=1)):
+		frappe.throw(_("Mpesa load runs need an Mpesa Settings record"))
+
+	settings = frappe.get_doc("Mpesa Settings", gateway[0])
+
+	started = time.perf_counter()
+	with patch.object(settings, "handle_api_responses", wraps=settings.handle_api_responses) as handle:
+		settings.request_for_payment(
+			payment_gateway=f"Mpesa-{settings.name}",
+			request_amount=payment["amount"],
+			sender="0712345678",
+			payment_reference=payment.get("reference_docname"),
+			reference_doctype=payment.get("reference_doctype"),
+			reference_docname=payment.get("reference_docname"),
+		)
+	stk_push_time = time.perf_counter() - started
+
+	_global_id, request_dicts, responses = handle.call_args.args
+	started = time.perf_counter()
+	for request_dict, response in zip(request_dicts, responses, strict=True):
+		verify_transaction(
+			Body={
+				"stkCallback": {
+					"CheckoutRequestID": response.CheckoutRequestID,
+					"ResultCode": 0,
+					"ResultDesc": "The service request is processed successfully.",
+					"CallbackMetadata": {
+						"Item": [
+							{"Name": "Amount", "Value": request_dict.request_amount},
+							{"Name": "MpesaReceiptNumber", "Value": frappe.generate_hash(length=10).upper()},
+						]
+					},
+				}
+			}
+		)
+	callback_time = time.perf_counter() - started
+
+	return {"stk_push": stk_push_time, "callback": callback_time}
+
+
+def paytm_checkout(payment):
+	from paytmchecksum import generateSignature
+
+	from payments.payment_gateways.doctype.paytm_settings.paytm_settings import (
+		get_paytm_config,
+		get_paytm_params,
+		verify_transaction,
+	)
+
+	settings = frappe.get_doc("Paytm Settings")
+
+	started = time.perf_counter()
+	url = settings.get_payment_url(**payment)
+	order_id = parse_qs(urlsplit(url).query)["order_id"][0]
+	config = get_paytm_config()
+	get_paytm_params(payment, order_id, config)
+	payment_url_time = time.perf_counter() - started
+
+	callback = {
+		"MID": config.merchant_id,
+		"ORDERID": order_id,
+		"TXNID": frappe.generate_hash(length=20),
+		"TXNAMOUNT": str(payment["amount"]),
+		"STATUS": "TXN_SUCCESS",
+		"RESPCODE": "01",
+		"RESPMSG": "Txn Success",
+	}
+	callback["CHECKSUMHASH"] = generateSignature(callback, config.merchant_key)
+
+	started = time.perf_counter()
+	verify_transaction(**callback)
+	callback_time = time.perf_counter() - started
+
+	assert_completed([order_id])
+	return {"get_payment_url": payment_url_time, "callback": callback_time}
+
+
+def paypal_checkout(payment):
+	from payments.payment_gateways.doctype.paypal_settings.paypal_settings import (
+		confirm_payment,
+		get_express_checkout_details,
+	)
+
+	settings = frappe.get_doc("PayPal Settings")
+
+	started = time.perf_counter()
+	url = settings.get_payment_url(**payment)
+	payment_url_time = time.perf_counter() - started
+
+	token = parse_qs(urlsplit(url).query)["token"][0]
+	started = time.perf_counter()
+	get_express_checkout_details(token)
+	confirm_payment(token)
+	callback_time = time.perf_counter() - started
+
+	assert_completed([token])
+	return {"get_payment_url": payment_url_time, "callback": callback_time}
+
+
+def assert_completed(integration_requests):
+	# the callbacks log their errors instead of raising, so check the outcome
+	if not integration_requests or frappe.db.get_all(
+		"Integration Request", {"name": ("in", integration_requests), "status": ("!=", "Completed")}
+	):
+		raise Exception(f"Payment not completed: {integration_requests}")
+
+
+SCENARIOS = {
+	"Razorpay": razorpay_checkout,
+	"Paymob": paymob_checkout,
+	"Mpesa": mpesa_checkout,
+	"Paytm": paytm_checkout,
+	"PayPal": paypal_checkout,
+}
+
+DEFAULT_CURRENCIES = {"Razorpay": "INR", "Paymob": "EGP", "Mpesa": "KES", "Paytm": "INR", "PayPal": "USD"}
+# completing these checkouts runs `on_payment_authorized` of a reference document
+NEEDS_REFERENCE = ("Paytm",)
+
+
+def clear_cached_tokens():
+	"""Drop provider tokens cached for the whole site, so simulator and real tokens never mix"""
+	from payments.payment_gateways.paymob.connection import AUTH_TOKEN_CACHE_KEY
+
+	frappe.cache().delete_value(AUTH_TOKEN_CACHE_KEY)
+
+
+def run(
+	gateway="Razorpay",
+	iterations=100,
+	simulator_url=None,
+	latency_ms=0,
+	failure_rate=0,
+	amount=100,
+	currency=None,
+	reference_doctype=None,
+	reference_docname=None,
+):
+	"""Run `iterations` checkouts of `gateway` and return latency percentiles and throughput.
+
+	Without `simulator_url` a simulator is started in-process with the given latency and
+	failure rate; pass the URL of a separately started one to keep its load off this process.
+	"""
+	if gateway not in SCENARIOS:
+		frappe.throw(_("Load scenarios exist for {0} only").format(", ".join(SCENARIOS)))
+	if gateway in NEEDS_REFERENCE and not reference_docname:
+		frappe.throw(_("{0} load runs need a reference document").format(gateway))
+
+	simulator = None
+	if not simulator_url:
+		simulator = ProviderSimulator(
+			("127.0.0.1", 0), latency=latency_ms / 1000, failure_rate=failure_rate
+		).start()
+		simulator_url = simulator.url
+
+	payment = {
+		"amount": amount,
+		"currency": currency or DEFAULT_CURRENCIES[gateway],
+		"payer_name": "Load Test",
+		"payer_email": "load.test@example.com",
+		"reference_doctype": reference_doctype,
+		"reference_docname": reference_docname,
+	}
+
+	conf = frappe.local.conf
+	previous_overrides = conf.get("payments_http_host_overrides")
+	conf.payments_http_host_overrides = dict.fromkeys(SIMULATED_HOSTS, simulator_url)
+	reset_sessions()
+	clear_cached_tokens()
+
+	phases, totals, errors = {}, [], 0
+	started = time.perf_counter()
+	try:
+		for _i in range(iterations):
+			iteration_started = time.perf_counter()
+			try:
+				timings = SCENARIOS[gateway](payment.copy())
+			except Exception:
+				errors += 1
+				frappe.db.rollback()
+				continue
+
+			totals.append(time.perf_counter() - iteration_started)
+			for phase, seconds in timings.items():
+				phases.setdefault(phase, []).append(seconds)
+
+			frappe.db.commit()
+	finally:
+		elapsed = time.perf_counter() - started
+		conf.payments_http_host_overrides = previous_overrides
+		reset_sessions()
+		clear_cached_tokens()
+		if simulator:
+			simulator.shutdown()
+			simulator.server_close()
+
+	return {
+		"gateway": gateway,
+		"iterations": iterations,
+		"errors": errors,
+		"throughput_per_sec": round(len(totals) / elapsed, 2) if elapsed else None,
+		"latency_ms": {
+			phase: summarize(durations) for phase, durations in {**phases, "total": totals}.items()
+		},
+	}
+
+
+def summarize(durations):
+	"""Percentiles of `durations` (seconds) in milliseconds"""
+	if not durations:
+		return {}
+
+	durations = sorted(durations)
+	return {
+		"p50": _percentile(durations, 50),
+		"p95": _percentile(durations, 95),
+		"p99": _percentile(durations, 99),
+		"max": round(durations[-1] * 1000, 3),
+	}
+
+
+def _percentile(sorted_durations, percent):
+	# nearest-rank percentile
+	rank = max(math.ceil(percent / 100 * len(sorted_durations)), 1)
+	return round(sorted_durations[rank - 1] * 1000, 3)
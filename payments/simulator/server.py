@@ -0,0 +1,348 @@
+"""
+Local stand-in for the payment provider APIs used by this app.
+
+Serves the Razorpay, Paymob, Mpesa, Paytm and PayPal NVP endpoints the gateways call,
+with configurable latency and failure injection, so the gateways can be exercised and
+load tested without network access. It has no dependency on Frappe:
+
+    python -m payments.simulator.server --port 8787 --latency-ms 80 --jitter-ms 40 --failure-rate 0.01
+
+Point a site at it through `payments_http_host_overrides` in site_config.json, see
+`payments.utils.http`. Counters per endpoint are served at `GET /__simulator/stats`.
+"""
+
+import argparse
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# Provider hosts the simulator answers for
+SIMULATED_HOSTS = (
+	"api.razorpay.com",
+	"accept.paymob.com",
+	"sandbox.safaricom.co.ke",
+	"api.safaricom.co.ke",
+	"securegw-stage.paytm.in",
+	"securegw.paytm.in",
+	"api-3t.sandbox.paypal.com",
+	"api-3t.paypal.com",
+)
+
+JSON = "application/json"
+TEXT = "text/plain; charset=utf-8"
+
+
+def _id(prefix="", length=14):
+	return f"{prefix}{secrets.token_hex(length // 2)}"
+
+
+def _body(request):
+	"""Request body as a dict, for both JSON and form encoded bodies"""
+	length = int(request.headers.get("Content-Length") or 0)
+	raw = request.rfile.read(length).decode() if length else ""
+	if not raw:
+		return {}
+	if raw.lstrip().startswith("{"):
+		return json.loads(raw)
+	return {key: values[0] for key, values in parse_qs(raw).items()}
+
+
+# Razorpay
+
+
+def razorpay_create_order(request, match, body):
+	return 200, {
+		"id": _id("order_"),
+		"entity": "order",
+		"amount": int(body.get("amount") or 0),
+		"currency": body.get("currency") or "INR",
+		"receipt": body.get("receipt"),
+		"status": "created",
+		"created_at": int(time.time()),
+	}
+
+
+def razorpay_get_payment(request, match, body):
+	payment_id = match["payment_id"]
+	# ids like pay_captured_xxx / pay_failed_xxx select the state of the payment
+	status = "authorized"
+	for state in ("captured", "failed", "refunded"):
+		if payment_id.startswith(f"pay_{state}_"):
+			status = state
+
+	return 200, {"id": payment_id, "entity": "payment", "amount": 10000, "currency": "INR", "status": status}
+
+
+def razorpay_capture_payment(request, match, body):
+	return 200, {
+		"id": match["payment_id"],
+		"entity": "payment",
+		"amount": int(body.get("amount") or 0),
+		"status": "captured",
+	}
+
+
+def razorpay_list_payments(request, match, body):
+	return 200, {"entity": "collection", "count": 0, "items": []}
+
+
+def razorpay_create_subscription(request, match, body):
+	return 200, {"id": _id("sub_"), "entity": "subscription", "status": "created"}
+
+
+def razorpay_get_subscription(request, match, body):
+	return 200, {"id": match["subscription_id"], "entity": "subscription", "status": "active"}
+
+
+def razorpay_create_addon(request, match, body):
+	return 200, {"id": _id("ao_"), "entity": "addon", "subscription_id": match["subscription_id"]}
+
+
+def razorpay_cancel_subscription(request, match, body):
+	return 200, {"id": match["subscription_id"], "entity": "subscription", "status": "cancelled"}
+
+
+# Paymob
+
+
+def paymob_auth(request, match, body):
+	return 201, {"token": _id(length=64)}
+
+
+def paymob_create_order(request, match, body):
+	return 201, {
+		"id": random.randint(10**8, 10**9),
+		"amount_cents": int(body.get("amount_cents") or 0),
+		"currency": body.get("currency") or "EGP",
+	}
+
+
+def paymob_payment_key(request, match, body):
+	return 201, {"token": _id(length=64)}
+
+
+# Mpesa
+
+
+def mpesa_generate_token(request, match, body):
+	return 200, {"access_token": _id(length=28), "expires_in": "3599"}
+
+
+def mpesa_stk_push(request, match, body):
+	return 200, {
+		"MerchantRequestID": _id("29115-"),
+		"CheckoutRequestID": _id("ws_CO_"),
+		"ResponseCode": "0",
+		"ResponseDescription": "Success. Request accepted for processing",
+		"CustomerMessage": "Success. Request accepted for processing",
+	}
+
+
+def mpesa_account_balance(request, match, body):
+	return 200, {
+		"OriginatorConversationID": _id("10816-"),
+		"ConversationID": _id("AG_"),
+		"ResponseCode": "0",
+		"ResponseDescription": "Accept the service request successfully.",
+	}
+
+
+# Paytm
+
+
+def paytm_order_status(request, match, body):
+	order_id = body.get("ORDERID") or body.get("orderId")
+	return 200, {
+		"ORDERID": order_id,
+		"TXNID": _id(length=20),
+		"STATUS": "TXN_SUCCESS",
+		"RESPCODE": "01",
+		"RESPMSG": "Txn Success",
+	}
+
+
+# PayPal NVP
+
+
+def paypal_nvp(request, match, body):
+	response = {
+		"ACK": "Success",
+		"CORRELATIONID": _id(length=12),
+		"TOKEN": body.get("TOKEN") or _id("EC-", 16),
+	}
+	method = body.get("METHOD")
+	if method == "DoExpressCheckoutPayment":
+		response.update(
+			PAYMENTINFO_0_PAYMENTSTATUS="Completed",
+			PAYMENTINFO_0_TRANSACTIONID=_id(length=16),
+			PAYMENTINFO_0_ACK="Success",
+		)
+	elif method == "GetExpressCheckoutDetails":
+		response.update(PAYERID=_id(length=13).upper(), EMAIL="payer@example.com")
+	elif method == "CreateRecurringPaymentsProfile":
+		response.update(PROFILEID=_id("I-", 12), PROFILESTATUS="ActiveProfile")
+	elif method == "GetRecurringPaymentsProfileDetails":
+		response.update(PROFILEID=body.get("PROFILEID"), STATUS="Active")
+
+	return 200, urlencode(response)
+
+
+ROUTES = [
+	(method, re.compile(f"^{pattern}$"), handler)
+	for method, pattern, handler in (
+		("POST", r"/v1/orders", razorpay_create_order),
+		("GET", r"/v1/payments", razorpay_list_payments),
+		("GET", r"/v1/payments/(?P<payment_id>[\w-]+)", razorpay_get_payment),
+		("POST", r"/v1/payments/(?P<payment_id>[\w-]+)/capture", razorpay_capture_payment),
+		("POST", r"/v1/subscriptions", razorpay_create_subscription),
+		("GET", r"/v1/subscriptions/(?P<subscription_id>[\w-]+)", razorpay_get_subscription),
+		("POST", r"/v1/subscriptions/(?P<subscription_id>[\w-]+)/addons", razorpay_create_addon),
+		("POST", r"/v1/subscriptions/(?P<subscription_id>[\w-]+)/cancel", razorpay_cancel_subscription),
+		("POST", r"/+api/auth/tokens", paymob_auth),
+		("POST", r"/+api/ecommerce/orders", paymob_create_order),
+		("POST", r"/+api/acceptance/payment_keys", paymob_payment_key),
+		("GET", r"/oauth/v1/generate", mpesa_generate_token),
+		("POST", r"/mpesa/stkpush/v1/processrequest", mpesa_stk_push),
+		("POST", r"/mpesa/accountbalance/v1/query", mpesa_account_balance),
+		("POST", r"/order/status", paytm_order_status),
+		("POST", r"/nvp", paypal_nvp),
+	)
+]
+
+
+def find_route(method, path):
+	"""Return the route pattern, handler and match for a request, or Nones if nothing matches"""
+	for route_method, pattern, handler in ROUTES:
+		if route_method == method and (match := pattern.match(path)):
+			return pattern.pattern[1:-1], handler, match
+
+	return None, None, None
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+	server: "ProviderSimulator"
+	protocol_version = "HTTP/1.1"
+
+	def do_GET(self):
+		self.dispatch("GET")
+
+	def do_POST(self):
+		self.dispatch("POST")
+
+	def dispatch(self, method):
+		path = urlsplit(self.path).path.rstrip("/") or "/"
+		body = _body(self)
+
+		if method == "GET" and path == "/__simulator/stats":
+			return self.respond(200, self.server.get_stats())
+
+		route, handler, match = find_route(method, path)
+		if not handler:
+			self.server.count(f"{method} <unknown>")
+			return self.respond(404, {"error": {"code": "NOT_FOUND", "description": path}})
+
+		self.server.count(f"{method} {route}")
+		self.server.delay()
+		if self.server.should_fail():
+			self.server.count("injected failures")
+			return self.respond(503, {"error": {"code": "SERVER_ERROR", "description": "Injected failure"}})
+
+		status, payload = handler(self, match, body)
+		self.respond(status, payload)
+
+	def respond(self, status, payload):
+		if isinstance(payload, str):
+			content, content_type = payload.encode(), TEXT
+		else:
+			content, content_type = json.dumps(payload).encode(), JSON
+
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+
+	def log_message(self, format, *args):
+		if self.server.verbose:
+			super().log_message(format, *args)
+
+
+class ProviderSimulator(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, address=("127.0.0.1", 8787), latency=0.0, jitter=0.0, failure_rate=0.0, verbose=False):
+		"""
+		Args:
+		        latency (float): Seconds added to every response
+		        jitter (float): Up to this many extra seconds, picked at random per response
+		        failure_rate (float): Share of requests, 0 to 1, answered with HTTP 503
+		"""
+		super().__init__(address, SimulatorHandler)
+		self.latency = latency
+		self.jitter = jitter
+		self.failure_rate = failure_rate
+		self.verbose = verbose
+		self._counter = Counter()
+		self._counter_lock = threading.Lock()
+
+	@property
+	def url(self):
+		host, port = self.server_address[:2]
+		return f"http://{host}:{port}"
+
+	def delay(self):
+		if wait := self.latency + random.uniform(0, self.jitter):
+			time.sleep(wait)
+
+	def should_fail(self):
+		return self.failure_rate > 0 and random.random() < self.failure_rate
+
+	def count(self, key):
+		with self._counter_lock:
+			self._counter[key] += 1
+
+	def get_stats(self):
+		with self._counter_lock:
+			return dict(self._counter)
+
+	def start(self):
+		"""Serve from a background thread, for use inside tests and load runs"""
+		thread = threading.Thread(target=self.serve_forever, daemon=True)
+		thread.start()
+		return self
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+	)
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8787)
+	parser.add_argument("--latency-ms", type=float, default=0)
+	parser.add_argument("--jitter-ms", type=float, default=0)
+	parser.add_argument("--failure-rate", type=float, default=0)
+	parser.add_argument("--verbose", action="store_true")
+	args = parser.parse_args()
+
+	simulator = ProviderSimulator(
+		(args.host, args.port),
+		latency=args.latency_ms / 1000,
+		jitter=args.jitter_ms / 1000,
+		failure_rate=args.failure_rate,
+		verbose=args.verbose,
+	)
+	print(f"Simulating {', '.join(SIMULATED_HOSTS)} on {simulator.url}")
+	try:
+		simulator.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -11,6 +11,7 @@ from payments.payment_gateways.doctype.braintree_settings.braintree_settings imp
 	get_client_token,
 	get_gateway_controller,
 )
+from payments.utils import get_checkout_context
 
 no_cache = 1
 
@@ -40,7 +41,7 @@ def get_context(context):
 		context["amount"] = flt(context["amount"])
 
 		gateway_controller = get_gateway_controller(context.reference_docname)
-		context["header_img"] = frappe.db.get_value("Braintree Settings", gateway_controller, "header_img")
+		context["header_img"] = get_checkout_context("Braintree Settings", gateway_controller).header_img
 
 	else:
 		frappe.redirect_to_message(
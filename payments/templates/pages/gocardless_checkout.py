@@ -11,6 +11,7 @@ from payments.payment_gateways.doctype.gocardless_settings.gocardless_settings i
     get_gateway_controller,
     gocardless_initialization,
 )
+from payments.utils import get_checkout_context
 
 no_cache = 1
 
@@ -38,8 +39,8 @@ def get_context(context):
         context["amount"] = flt(context["amount"])
 
         gateway_controller = get_gateway_controller(context.reference_docname)
-        context["header_img"] = frappe.db.get_value(
-            "GoCardless Settings", gateway_controller, "header_img")
+        context["header_img"] = get_checkout_context(
+            "GoCardless Settings", gateway_controller).header_img
 
     else:
         frappe.redirect_to_message(
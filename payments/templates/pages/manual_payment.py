@@ -3,6 +3,14 @@
 
 import frappe
 
+from payments.payment_gateways.doctype.code_payment_gateways.code_payment_gateways import (
+    get_redeemable_codes,
+    has_enabled_codes,
+    normalize_code,
+    redeem_code,
+)
+from payments.utils import get_affected_rows
+
 no_cache = True
 
 
@@ -24,45 +32,11 @@ def get_context(context):
 
     # Check if Code Payment Gateways is enabled
     try:
-        # Check if any enabled codes exist
-        code_gateway_exists = frappe.db.exists(
-            "Code Payment Gateways",
-            {"enabled": 1}
-        )
-        context.code_gateway_enabled = bool(code_gateway_exists)
-
-        if code_gateway_exists:
-            # Get user's available codes (with remaining amount > 0 or free codes)
-            if context.current_user != "Guest":
-                context.user_codes = []
-                # Query all enabled codes for the current user
-                user_codes_list = frappe.get_all(
-                    "Code Payment Gateways",
-                    filters={
-                        "enabled": 1,
-                        "student": context.current_user
-                    },
-                    fields=["code", "free_code", "code_amount",
-                            "code_remaining_amount", "code_used_amount"],
-                    order_by="creation desc"
-                )
+        context.code_gateway_enabled = has_enabled_codes()
 
-                for code_doc in user_codes_list:
-                    # Check if code has remaining amount or is a free code
-                    remaining = float(code_doc.code_remaining_amount or 0)
-                    is_valid = code_doc.free_code or remaining > 0
-                    
-                    if is_valid:
-                        context.user_codes.append({
-                            "code": code_doc.code,
-                            "amount": code_doc.code_amount if not code_doc.free_code else 0,
-                            "free_code": code_doc.free_code,
-                            "remaining_amount": code_doc.code_remaining_amount if not code_doc.free_code else None
-                        })
-            else:
-                context.user_codes = []
-        else:
-            context.user_codes = []
+        # Get user's available codes (with remaining amount > 0 or free codes)
+        if context.code_gateway_enabled and context.current_user != "Guest":
+            context.user_codes = get_redeemable_codes(context.current_user)
     except Exception as e:
         frappe.log_error(f"Error in manual_payment get_context: {str(e)}")
         context.code_gateway_enabled = False
@@ -113,13 +87,20 @@ def confirm_manual_payment(token, code):
                 "message": "Payment token is required"
             }
         
-        try:
-            integration_request = frappe.get_doc("Integration Request", token)
-        except frappe.DoesNotExistError:
+        integration_request = frappe.db.get_value(
+            "Integration Request", token, ["name", "data", "status"], as_dict=True
+        )
+        if not integration_request:
             return {
                 "success": False,
                 "message": "Invalid payment token"
             }
+
+        if integration_request.status == "Completed":
+            return {
+                "success": False,
+                "message": "This payment has already been confirmed"
+            }
         
         # Parse payment data safely
         try:
@@ -133,13 +114,11 @@ def confirm_manual_payment(token, code):
         
         payment_amount = float(payment_data.get("amount", 0))
 
-        # Search for the code directly in Code Payment Gateways
-        code_upper = code.upper().strip()
+        # Codes are stored normalized, this is a lookup on the unique code index
         code_doc = frappe.db.get_value(
             "Code Payment Gateways",
-            {"code": code_upper, "enabled": 1},
-            ["name", "student", "free_code", "code_amount",
-             "code_used_amount", "code_remaining_amount"],
+            {"code": normalize_code(code), "enabled": 1},
+            ["name", "student", "free_code", "code_remaining_amount"],
             as_dict=True
         )
 
@@ -156,42 +135,40 @@ def confirm_manual_payment(token, code):
                 "message": "This code is not assigned to you"
             }
 
-        # Get the full document to update
-        code_gateway = frappe.get_doc("Code Payment Gateways", code_doc.name)
-
-        # Check if it's a free code
-        if code_gateway.free_code:
-            # Free codes can be used for any amount
-            # No need to check remaining amount
-            pass
-        else:
-            # For paid codes, check remaining amount
-            remaining_amount = float(code_gateway.code_remaining_amount or 0)
+        # Mark the integration request first, a concurrent confirmation of the
+        # same token then finds it completed instead of redeeming the code twice
+        integration_request_table = frappe.qb.DocType("Integration Request")
+        (
+            frappe.qb.update(integration_request_table)
+            .set(integration_request_table.status, "Completed")
+            .set(integration_request_table.modified, frappe.utils.now())
+            .where(integration_request_table.name == integration_request.name)
+            .where(integration_request_table.status != "Completed")
+        ).run()
+        if not get_affected_rows():
+            frappe.db.rollback()
+            return {
+                "success": False,
+                "message": "This payment has already been confirmed"
+            }
+
+        # Free codes can be used for any amount, paid codes are deducted with a
+        # conditional update that fails if the remaining amount is insufficient
+        if not code_doc.free_code and redeem_code(code_doc.name, payment_amount) is None:
+            frappe.db.rollback()
+
+            remaining_amount = float(code_doc.code_remaining_amount or 0)
             if remaining_amount <= 0:
                 return {
                     "success": False,
                     "message": "This code has no remaining balance. Please contact administrator to get a new code."
                 }
 
-            # Check if payment amount is within remaining limit
-            if payment_amount > remaining_amount:
-                return {
-                    "success": False,
-                    "message": f"Payment amount ({payment_amount}) exceeds code remaining limit ({remaining_amount})"
-                }
-
-            # Update used and remaining amounts
-            current_used = float(code_gateway.code_used_amount or 0)
-            code_gateway.code_used_amount = current_used + payment_amount
-            code_gateway.code_remaining_amount = remaining_amount - payment_amount
-
-        # Save the updated code
-        code_gateway.save(ignore_permissions=True)
-        frappe.db.commit()
+            return {
+                "success": False,
+                "message": f"Payment amount ({payment_amount}) exceeds code remaining limit ({remaining_amount})"
+            }
 
-        # Update integration request status
-        integration_request.status = "Completed"
-        integration_request.save(ignore_permissions=True)
         frappe.db.commit()
 
         # Get redirect URL
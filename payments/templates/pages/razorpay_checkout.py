@@ -6,6 +6,7 @@ import frappe
 from frappe import _
 from frappe.utils import cint, flt
 
+from payments.utils import get_checkout_context
 from payments.utils.utils import validate_integration_request
 
 no_cache = 1
@@ -56,7 +57,7 @@ def get_context(context):
 
 
 def get_api_key():
-	api_key = frappe.db.get_single_value("Razorpay Settings", "api_key")
+	api_key = get_checkout_context("Razorpay Settings").api_key
 	if cint(frappe.form_dict.get("use_sandbox")):
 		api_key = frappe.conf.sandbox_api_key
 
@@ -9,6 +9,7 @@ from frappe.utils import cint, fmt_money
 from payments.payment_gateways.doctype.stripe_settings.stripe_settings import (
 	get_gateway_controller,
 )
+from payments.utils import get_checkout_context
 
 no_cache = 1
 
@@ -44,7 +45,7 @@ def get_context(context):
 			payment_plan = frappe.db.get_value(
 				context.reference_doctype, context.reference_docname, "payment_plan"
 			)
-			recurrence = frappe.db.get_value("Payment Plan", payment_plan, "recurrence")
+			recurrence = frappe.get_cached_value("Payment Plan", payment_plan, "recurrence")
 
 			context["amount"] = context["amount"] + " " + _(recurrence)
 
@@ -58,7 +59,7 @@ def get_context(context):
 
 
 def get_api_key(doc, gateway_controller):
-	publishable_key = frappe.db.get_value("Stripe Settings", gateway_controller, "publishable_key")
+	publishable_key = get_checkout_context("Stripe Settings", gateway_controller).publishable_key
 	if cint(frappe.form_dict.get("use_sandbox")):
 		publishable_key = frappe.conf.sandbox_publishable_key
 
@@ -66,7 +67,7 @@ def get_api_key(doc, gateway_controller):
 
 
 def get_header_image(doc, gateway_controller):
-	return frappe.db.get_value("Stripe Settings", gateway_controller, "header_img")
+	return get_checkout_context("Stripe Settings", gateway_controller).header_img
 
 
 @frappe.whitelist(allow_guest=True)
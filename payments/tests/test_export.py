@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+
+import frappe
+from frappe.integrations.utils import create_request_log
+from frappe.tests.utils import FrappeTestCase
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from payments.utils.export import (
+	download_integration_requests,
+	export_integration_requests,
+	iter_integration_requests,
+)
+
+SERVICE = "_Test Export"
+
+
+class TestExport(FrappeTestCase):
+	# request logs are committed on creation, so rows are removed by hand
+	def setUp(self):
+		self.integration_requests = [
+			create_request_log({"amount": i, "note": f"line\nbreak {i}"}, service_name=SERVICE).name
+			for i in range(7)
+		]
+
+		# three groups of requests created in the same instant, so pages end inside a tie
+		table = frappe.qb.DocType("Integration Request")
+		for i, name in enumerate(self.integration_requests):
+			creation = f"2025-01-01 10:00:0{i // 3}"
+			frappe.qb.update(table).set(table.creation, creation).set(table.modified, creation).where(
+				table.name == name
+			).run()
+		frappe.db.commit()
+
+	def tearDown(self):
+		frappe.set_user("Administrator")
+		frappe.db.rollback()
+		frappe.db.delete("Integration Request", {"integration_request_service": SERVICE})
+		frappe.db.commit()
+
+	def get_expected(self):
+		return [
+			name
+			for _creation, name in sorted(
+				frappe.get_all(
+					"Integration Request",
+					filters={"integration_request_service": SERVICE},
+					fields=["creation", "name"],
+					as_list=True,
+				)
+			)
+		]
+
+	def test_pages_skip_and_repeat_nothing(self):
+		expected = self.get_expected()
+		self.assertEqual(sorted(expected), sorted(self.integration_requests))
+
+		for chunk_size in (1, 2, 3, 4, 7, 8):
+			with self.subTest(chunk_size):
+				rows = iter_integration_requests(service_name=SERVICE, chunk_size=chunk_size)
+				self.assertEqual([row.name for row in rows], expected)
+
+	def test_filters(self):
+		names = [
+			row.name
+			for row in iter_integration_requests(
+				service_name=SERVICE,
+				from_date="2025-01-01 10:00:01",
+				to_date="2025-01-01 10:00:02",
+				chunk_size=2,
+			)
+		]
+
+		self.assertEqual(names, self.get_expected()[3:6])
+
+	def test_jsonl(self):
+		file = io.StringIO()
+		export_integration_requests(file, "jsonl", service_name=SERVICE)
+
+		rows = [json.loads(line) for line in file.getvalue().splitlines()]
+		self.assertEqual([row["name"] for row in rows], self.get_expected())
+		# stored JSON is passed through as an object, not re-encoded as a string
+		self.assertEqual({row["data"]["amount"] for row in rows}, set(range(7)))
+
+	def test_download(self):
+		self.addCleanup(setattr, frappe.local, "request", getattr(frappe.local, "request", None))
+		frappe.local.request = Request(EnvironBuilder(method="GET").get_environ())
+
+		response = download_integration_requests(service_name=SERVICE)
+
+		rows = list(csv.DictReader(io.StringIO(b"".join(response.response).decode())))
+		self.assertEqual([row["name"] for row in rows], self.get_expected())
+		self.assertIn(
+			'filename="integration-requests-_Test Export.csv"', response.headers["Content-Disposition"]
+		)
+
+	def test_download_permission(self):
+		frappe.set_user("Guest")
+
+		with self.assertRaises(frappe.PermissionError):
+			download_integration_requests(service_name=SERVICE)
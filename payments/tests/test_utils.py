@@ -0,0 +1,77 @@
+import threading
+import time
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from payments.utils import get_cached_token
+
+TOKEN_KEY = "_test_cached_token"
+
+
+class TestCachedToken(FrappeTestCase):
+	def setUp(self):
+		frappe.cache().delete_value(TOKEN_KEY)
+		self.generated = 0
+		self.generate_lock = threading.Lock()
+
+	def tearDown(self):
+		frappe.cache().delete_value(TOKEN_KEY)
+
+	def generate_token(self, expires_in=3600, delay=0):
+		def generate():
+			# slow enough for concurrent callers to find the refresh lock taken
+			time.sleep(delay)
+			with self.generate_lock:
+				self.generated += 1
+				return f"token-{self.generated}", expires_in
+
+		return generate
+
+	def test_token_is_cached(self):
+		generate = self.generate_token()
+
+		self.assertEqual(get_cached_token(TOKEN_KEY, generate), "token-1")
+		self.assertEqual(get_cached_token(TOKEN_KEY, generate), "token-1")
+		self.assertEqual(self.generated, 1)
+
+	def test_token_is_refreshed_ahead_of_expiry(self):
+		# expires within the refresh window, so it is replaced before it is ever sent
+		generate = self.generate_token(expires_in=30)
+
+		self.assertEqual(get_cached_token(TOKEN_KEY, generate, refresh_ahead=60), "token-1")
+		self.assertEqual(get_cached_token(TOKEN_KEY, generate, refresh_ahead=60), "token-2")
+		self.assertEqual(get_cached_token(TOKEN_KEY, generate, refresh_ahead=10), "token-2")
+
+	def test_concurrent_callers_generate_once(self):
+		generate = self.generate_token(delay=0.5)
+		site, sites_path = frappe.local.site, frappe.local.sites_path
+		barrier = threading.Barrier(5)
+		tokens = []
+
+		def get_token():
+			frappe.init(site=site, sites_path=sites_path)
+			try:
+				barrier.wait()
+				tokens.append(get_cached_token(TOKEN_KEY, generate))
+			finally:
+				frappe.destroy()
+
+		threads = [threading.Thread(target=get_token) for _i in range(5)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(tokens, ["token-1"] * 5)
+		self.assertEqual(self.generated, 1)
+
+	def test_stuck_refresh_is_bypassed(self):
+		cache = frappe.cache()
+		lock = cache.lock(cache.make_key(f"{TOKEN_KEY}|refresh"), timeout=10)
+		self.assertTrue(lock.acquire(blocking=False))
+		self.addCleanup(lock.release)
+
+		self.assertEqual(get_cached_token(TOKEN_KEY, self.generate_token(), lock_timeout=1), "token-1")
+		# the bypassing token is not cached, the lock holder will store its own
+		self.assertIsNone(cache.get_value(TOKEN_KEY))
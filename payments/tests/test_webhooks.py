@@ -0,0 +1,157 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from payments.utils import webhooks
+from payments.utils.webhooks import (
+	enqueue_webhook_event,
+	get_webhook_event_counts,
+	process_webhook_event,
+	record_webhook_event,
+	record_webhook_events,
+)
+
+SERVICE = "_Test Webhooks"
+
+
+def complete_event(doctype, docname):
+	pass
+
+
+def cancel_event(doctype, docname):
+	frappe.db.set_value(doctype, docname, "status", "Cancelled")
+
+
+def fail_event(doctype, docname):
+	frappe.db.set_value(doctype, docname, "output", "half done")
+	raise Exception("handler failed")
+
+
+class TestWebhooks(FrappeTestCase):
+	# the ledger commits every recorded event, so rows are removed by hand
+	def tearDown(self):
+		frappe.db.rollback()
+		frappe.db.delete("Integration Request", {"integration_request_service": SERVICE})
+		frappe.db.commit()
+
+	def get_events(self):
+		return frappe.get_all(
+			"Integration Request",
+			filters={"integration_request_service": SERVICE},
+			fields=["name", "status", "webhook_event"],
+		)
+
+	def get_duplicates(self):
+		return get_webhook_event_counts(SERVICE)["duplicates"]
+
+	def test_redelivered_event_is_stored_once(self):
+		duplicates = self.get_duplicates()
+		name = record_webhook_event(SERVICE, "EV1", {"id": "EV1"})
+
+		# still queued, and its job is waiting
+		with patch.object(webhooks, "is_job_enqueued", return_value=True):
+			self.assertIsNone(record_webhook_event(SERVICE, "EV1", {"id": "EV1"}))
+
+		frappe.db.set_value("Integration Request", name, "status", "Completed")
+		self.assertIsNone(record_webhook_event(SERVICE, "EV1", {"id": "EV1"}))
+
+		events = self.get_events()
+		self.assertEqual([(event.name, event.webhook_event) for event in events], [(name, 1)])
+		self.assertEqual(self.get_duplicates(), duplicates + 2)
+
+	def test_unprocessed_event_is_queued_again(self):
+		name = record_webhook_event(SERVICE, "EV1", {"id": "EV1"})
+
+		# queued without a job, e.g. the job was lost
+		self.assertEqual(record_webhook_event(SERVICE, "EV1", {"id": "EV1"}), name)
+
+		frappe.db.set_value("Integration Request", name, "status", "Failed")
+		self.assertEqual(record_webhook_event(SERVICE, "EV1", {"id": "EV1"}), name)
+		self.assertEqual(frappe.db.get_value("Integration Request", name, "status"), "Queued")
+		self.assertEqual(len(self.get_events()), 1)
+
+	def test_event_without_key_is_named_by_payload(self):
+		first = record_webhook_event(SERVICE, None, {"id": "EV1"})
+		frappe.db.set_value("Integration Request", first, "status", "Completed")
+
+		self.assertIsNone(record_webhook_event(SERVICE, None, {"id": "EV1"}))
+		self.assertNotEqual(record_webhook_event(SERVICE, None, {"id": "EV2"}), first)
+
+	def test_record_batch(self):
+		completed = record_webhook_event(SERVICE, "EV1", {"id": "EV1"})
+		failed = record_webhook_event(SERVICE, "EV2", {"id": "EV2"})
+		frappe.db.set_value("Integration Request", completed, "status", "Completed")
+		frappe.db.set_value("Integration Request", failed, "status", "Failed")
+		duplicates = self.get_duplicates()
+
+		events = record_webhook_events(
+			SERVICE,
+			[
+				("EV1", {"id": "EV1"}),
+				("EV2", {"id": "EV2"}),
+				("EV3", {"id": "EV3"}),
+				("EV3", {"id": "EV3"}),
+			],
+		)
+
+		self.assertEqual(sorted(events.values(), key=lambda data: data["id"]), [{"id": "EV2"}, {"id": "EV3"}])
+		self.assertEqual({event.status for event in self.get_events() if event.name in events}, {"Queued"})
+		self.assertEqual(len(self.get_events()), 3)
+		self.assertEqual(self.get_duplicates(), duplicates + 2)
+
+	def test_enqueue(self):
+		with patch.object(frappe, "enqueue") as enqueue:
+			enqueue_webhook_event("Razorpay-EV1", "payments.tests.test_webhooks.complete_event")
+
+		enqueue.assert_called_once()
+		self.assertEqual(enqueue.call_args.args, ("payments.utils.webhooks.process_webhook_event",))
+		self.assertEqual(enqueue.call_args.kwargs["job_id"], "webhook_event_Razorpay-EV1")
+		self.assertTrue(enqueue.call_args.kwargs["deduplicate"])
+		self.assertEqual(enqueue.call_args.kwargs["name"], "Razorpay-EV1")
+
+	def test_processing_completes_event(self):
+		name = record_webhook_event(SERVICE, "EV1", {"id": "EV1"})
+		process_webhook_event(name, "payments.tests.test_webhooks.complete_event")
+
+		self.assertEqual(frappe.db.get_value("Integration Request", name, "status"), "Completed")
+
+	def test_processing_keeps_handler_status(self):
+		name = record_webhook_event(SERVICE, "EV1", {"id": "EV1"})
+		process_webhook_event(name, "payments.tests.test_webhooks.cancel_event")
+
+		self.assertEqual(frappe.db.get_value("Integration Request", name, "status"), "Cancelled")
+
+	def test_failed_processing(self):
+		name = record_webhook_event(SERVICE, "EV1", {"id": "EV1"})
+		process_webhook_event(name, "payments.tests.test_webhooks.fail_event")
+
+		status, error, output = frappe.db.get_value(
+			"Integration Request", name, ["status", "error", "output"]
+		)
+		self.assertEqual(status, "Failed")
+		self.assertIn("handler failed", error)
+		# the handler's own writes are rolled back
+		self.assertNotEqual(output, "half done")
+
+		# a redelivery is processed again
+		self.assertEqual(record_webhook_event(SERVICE, "EV1", {"id": "EV1"}), name)
+
+	def test_processed_event_is_skipped(self):
+		name = record_webhook_event(SERVICE, "EV1", {"id": "EV1"})
+		frappe.db.set_value("Integration Request", name, "status", "Completed")
+		frappe.db.commit()
+
+		process_webhook_event(name, "payments.tests.test_webhooks.fail_event")
+
+		self.assertEqual(frappe.db.get_value("Integration Request", name, "status"), "Completed")
+
+	def test_counts(self):
+		for key, status in (("EV1", "Completed"), ("EV2", "Completed"), ("EV3", "Failed"), ("EV4", None)):
+			name = record_webhook_event(SERVICE, key, {"id": key})
+			if status:
+				frappe.db.set_value("Integration Request", name, "status", status)
+
+		counts = get_webhook_event_counts(SERVICE)
+
+		self.assertEqual((counts["processed"], counts["failed"], counts["pending"]), (2, 1, 1))
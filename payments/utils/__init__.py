@@ -1,8 +1,24 @@
+from payments.utils.http import get_session, make_get_request, make_post_request
 from payments.utils.utils import (
 	before_install,
+	bulk_create_request_logs,
+	clear_checkout_context_cache,
+	clear_payment_gateway_controller_cache,
 	create_payment_gateway,
 	delete_custom_fields,
 	erpnext_app_import_guard,
+	get_affected_rows,
+	get_cached_token,
+	get_checkout_context,
+	get_integration_request_by_reference,
 	get_payment_gateway_controller,
 	make_custom_fields,
+	make_integration_request_fields,
+	map_concurrently,
+)
+from payments.utils.webhooks import (
+	enqueue_webhook_event,
+	record_webhook_event,
+	record_webhook_events,
+	set_webhook_event_status,
 )
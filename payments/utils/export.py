@@ -0,0 +1,130 @@
+"""
+Constant-memory export of Integration Requests for reconciliation.
+
+Rows are read in keyset-paginated chunks ordered by `(creation, name)`, so the database
+never materializes more than one chunk and deep pages stay as cheap as the first one.
+The `data` / `output` JSON is passed through as stored instead of being parsed.
+"""
+
+import csv
+import io
+import json
+import tempfile
+
+import frappe
+from frappe import _
+from frappe.query_builder import Criterion
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+EXPORT_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"integration_request_service",
+	"status",
+	"reference_doctype",
+	"reference_docname",
+	"gateway_reference",
+	"data",
+	"output",
+	"error",
+)
+JSON_FIELDS = ("data", "output")
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_CHUNK_SIZE = 1000
+
+
+def iter_integration_requests(
+	service_name=None, from_date=None, to_date=None, status=None, chunk_size=EXPORT_CHUNK_SIZE
+):
+	"""Yield Integration Requests as dicts, oldest first, `chunk_size` rows per query"""
+	table = frappe.qb.DocType("Integration Request")
+
+	conditions = []
+	if service_name:
+		conditions.append(table.integration_request_service == service_name)
+	if status:
+		conditions.append(table.status == status)
+	if from_date:
+		conditions.append(table.creation >= from_date)
+	if to_date:
+		conditions.append(table.creation < to_date)
+
+	last_creation = last_name = None
+	while True:
+		query = (
+			frappe.qb.from_(table)
+			.select(*(table[field] for field in EXPORT_FIELDS))
+			.orderby(table.creation)
+			.orderby(table.name)
+			.limit(chunk_size)
+		)
+		if conditions:
+			query = query.where(Criterion.all(conditions))
+		if last_creation is not None:
+			query = query.where(
+				(table.creation > last_creation)
+				| ((table.creation == last_creation) & (table.name > last_name))
+			)
+
+		rows = query.run(as_dict=True)
+		yield from rows
+
+		if len(rows) < chunk_size:
+			return
+
+		last_creation, last_name = rows[-1].creation, rows[-1].name
+
+
+def write_csv(rows, file):
+	writer = csv.writer(file)
+	writer.writerow(EXPORT_FIELDS)
+	for row in rows:
+		writer.writerow(row[field] for field in EXPORT_FIELDS)
+
+
+def write_jsonl(rows, file):
+	for row in rows:
+		file.write("{")
+		file.write(",".join(f"{json.dumps(field)}:{_to_json(field, row[field])}" for field in EXPORT_FIELDS))
+		file.write("}\n")
+
+
+def _to_json(field, value):
+	if field in JSON_FIELDS and isinstance(value, str) and value.lstrip()[:1] in ("{", "["):
+		# stored as JSON already, pass it through unparsed
+		return value.replace("\n", " ")
+	return json.dumps(value, default=str)
+
+
+def export_integration_requests(file, format="csv", **filters):
+	"""Write the Integration Requests matching `filters` to `file` as CSV or JSONL"""
+	if format not in EXPORT_FORMATS:
+		frappe.throw(_("Export format must be one of {0}").format(", ".join(EXPORT_FORMATS)))
+
+	writer = write_jsonl if format == "jsonl" else write_csv
+	writer(iter_integration_requests(**filters), file)
+
+
+@frappe.whitelist()
+def download_integration_requests(service_name=None, from_date=None, to_date=None, status=None, format="csv"):
+	"""Download Integration Requests for reconciliation, spooled to disk instead of memory"""
+	frappe.only_for(("System Manager", "Accounts Manager"))
+
+	file = tempfile.TemporaryFile()
+	text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+	export_integration_requests(
+		text, format, service_name=service_name, from_date=from_date, to_date=to_date, status=status
+	)
+	text.flush()
+	text.detach()
+	file.seek(0)
+
+	filename = f"integration-requests-{service_name or 'all'}.{format}"
+	return Response(
+		wrap_file(frappe.local.request.environ, file),
+		mimetype="text/csv" if format == "csv" else "application/x-ndjson",
+		headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+		direct_passthrough=True,
+	)
@@ -0,0 +1,121 @@
+"""
+Shared HTTP client for payment gateway API calls.
+
+Sessions live for the whole worker process and are kept per site and host, so repeated
+calls to the same provider reuse pooled keep-alive connections instead of paying a TCP + TLS
+handshake on every call. Pools, timeouts and retries can be tuned from site config:
+
+- `payments_http_pool_size`: connections kept alive per host (default 10)
+- `payments_http_timeout`: seconds before a request is abandoned (default 30)
+- `payments_http_max_retries`: retries with exponential backoff (default 3)
+- `payments_http_host_overrides`: provider host to base URL, e.g.
+  `{"api.razorpay.com": "http://127.0.0.1:8787"}` to send calls to `payments.simulator`
+
+Only connection errors and idempotent requests are retried, so a POST that reached the
+provider is never sent twice.
+"""
+
+import threading
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 3
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class PaymentsSession(requests.Session):
+	"""`requests.Session` that applies a default timeout to every request"""
+
+	def __init__(self, timeout=DEFAULT_TIMEOUT, base_url=None):
+		super().__init__()
+		self.timeout = timeout
+		self.base_url = urlsplit(base_url) if base_url else None
+
+	def request(self, method, url, **kwargs):
+		kwargs.setdefault("timeout", self.timeout)
+		if self.base_url:
+			url = urlunsplit(urlsplit(url)._replace(scheme=self.base_url.scheme, netloc=self.base_url.netloc))
+		return super().request(method, url, **kwargs)
+
+
+def get_session(url):
+	"""Return the current site's pooled session for the host of `url`.
+
+	The session itself carries no credentials, so pass `auth` / `headers` with each
+	request.
+	"""
+	parts = urlsplit(url)
+	key = (getattr(frappe.local, "site", None), parts.scheme, parts.netloc)
+
+	if (session := _sessions.get(key)) is None:
+		with _sessions_lock:
+			if (session := _sessions.get(key)) is None:
+				session = _sessions[key] = _make_session(parts.netloc)
+
+	return session
+
+
+def reset_sessions():
+	"""Close and drop the current site's sessions, so changed site config applies to the next call"""
+	site = getattr(frappe.local, "site", None)
+	with _sessions_lock:
+		for key in [key for key in _sessions if key[0] == site]:
+			_sessions.pop(key).close()
+
+
+def _make_session(host):
+	conf = getattr(frappe.local, "conf", None) or {}
+	pool_size = conf.get("payments_http_pool_size") or DEFAULT_POOL_SIZE
+
+	retries = Retry(
+		total=conf.get("payments_http_max_retries", DEFAULT_MAX_RETRIES),
+		backoff_factor=0.5,
+		status_forcelist=RETRY_STATUS_CODES,
+		raise_on_status=False,
+	)
+	adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+
+	session = PaymentsSession(
+		timeout=conf.get("payments_http_timeout") or DEFAULT_TIMEOUT,
+		base_url=(conf.get("payments_http_host_overrides") or {}).get(host),
+	)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
+
+
+def make_request(method, url, auth=None, headers=None, data=None, json=None, params=None):
+	"""Drop-in replacement for `frappe.integrations.utils.make_request` on pooled sessions"""
+	try:
+		response = frappe.flags.integration_request = get_session(url).request(
+			method, url, auth=auth or None, headers=headers, data=data, json=json, params=params
+		)
+		response.raise_for_status()
+
+		if content_type := response.headers.get("content-type"):
+			if content_type == "text/plain; charset=utf-8":
+				return parse_qs(response.text)
+			elif content_type.startswith("application/") and content_type.split(";")[0].endswith("json"):
+				return response.json()
+			elif response.text:
+				return response.text
+	except Exception:
+		frappe.log_error()
+		raise
+
+
+def make_get_request(url, **kwargs):
+	return make_request("GET", url, **kwargs)
+
+
+def make_post_request(url, **kwargs):
+	return make_request("POST", url, **kwargs)
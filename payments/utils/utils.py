@@ -1,9 +1,64 @@
-from contextlib import contextmanager
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
 
 import click
 import frappe
 from frappe import _
 from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+from redis.exceptions import LockError
+
+PAYMENT_GATEWAY_CONTROLLERS_KEY = "payment_gateway_controllers"
+CHECKOUT_CONTEXT_KEY = "payments_checkout_context"
+
+# Settings fields rendered on the checkout pages, publishable values only
+CHECKOUT_CONTEXT_FIELDS = {
+    "Braintree Settings": ("header_img",),
+    "GoCardless Settings": ("header_img",),
+    "Razorpay Settings": ("api_key",),
+    "Stripe Settings": ("publishable_key", "header_img"),
+}
+
+INTEGRATION_REQUEST_CUSTOM_FIELDS = [
+    # Order / transaction id assigned by the gateway, indexed so that
+    # callbacks can resolve their request without scanning `data`
+    {
+        "fieldname": "gateway_reference",
+        "fieldtype": "Data",
+        "label": "Gateway Reference",
+        "insert_after": "integration_request_service",
+        "read_only": 1,
+        "no_copy": 1,
+        "search_index": 1,
+    },
+    # Lease taken by a capture worker on an Authorized request so that
+    # concurrent workers never pick up the same row
+    {
+        "fieldname": "capture_claimed_by",
+        "fieldtype": "Data",
+        "label": "Capture Claimed By",
+        "insert_after": "status",
+        "read_only": 1,
+        "no_copy": 1,
+    },
+    {
+        "fieldname": "capture_claim_expires_on",
+        "fieldtype": "Datetime",
+        "label": "Capture Claim Expires On",
+        "insert_after": "capture_claimed_by",
+        "read_only": 1,
+        "no_copy": 1,
+    },
+    # Marks requests kept by the webhook event ledger, see `payments.utils.webhooks`
+    {
+        "fieldname": "webhook_event",
+        "fieldtype": "Check",
+        "label": "Webhook Event",
+        "insert_after": "is_remote_request",
+        "read_only": 1,
+        "no_copy": 1,
+    },
+]
 
 
 def validate_integration_request(docname: str | None):
@@ -11,38 +66,187 @@ def validate_integration_request(docname: str | None):
         frappe.throw(_("Expired Token"))
 
 
+def get_integration_request_by_reference(service_name, gateway_reference):
+    """Return the name of the latest Integration Request created for a gateway order / transaction id"""
+    return frappe.db.get_value(
+        "Integration Request",
+        {"integration_request_service": service_name, "gateway_reference": str(gateway_reference)},
+        "name",
+        order_by="creation desc",
+    )
+
+
+def get_affected_rows():
+    """Return the number of rows changed by the last UPDATE / DELETE run on `frappe.db`.
+
+    Lets a conditional update double as a compare-and-set: zero rows means the
+    condition did not hold, e.g. another request got there first.
+    """
+    return frappe.db._cursor.rowcount
+
+
+def map_concurrently(func, items, max_workers=8):
+    """Call `func` for every item on a bounded thread pool.
+
+    Returns a list of `(result, exception)` tuples in the same order as `items`.
+    Worker threads have no site context, so `func` must only do I/O (e.g. HTTP calls)
+    and must not touch `frappe.local`, `frappe.db` or `frappe.flags`. Get HTTP sessions
+    with `get_session` before and pass them in, as sessions made on a worker thread
+    ignore the site config.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def _call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        return list(executor.map(_call, items))
+
+
+def bulk_create_request_logs(
+    logs, service_name, request_description=None, is_remote_request=0, webhook_event=0
+):
+    """Insert several Integration Requests with a single multi-row INSERT.
+
+    `logs` is a list of `(name, data, error)` tuples. Requests that already exist are skipped.
+    Unlike `create_request_log` no document hooks run, so use it for plain request logs only.
+    Nothing is committed, the rows are part of the caller's transaction.
+    """
+    if not logs:
+        return
+
+    now = frappe.utils.now()
+    user = frappe.session.user
+    fields = (
+        "name", "creation", "modified", "owner", "modified_by", "docstatus",
+        "integration_request_service", "status", "data", "error",
+        "reference_doctype", "reference_docname", "request_description", "is_remote_request",
+        "webhook_event",
+    )
+    values = [
+        (
+            name, now, now, user, user, 0,
+            service_name, "Queued", frappe.as_json(data, indent=1),
+            frappe.as_json(error, indent=1) if error else None,
+            data.get("reference_doctype"), data.get("reference_docname"),
+            request_description, is_remote_request, webhook_event,
+        )
+        for name, data, error in logs
+    ]
+
+    frappe.db.bulk_insert("Integration Request", fields, values, ignore_duplicates=True)
+
+
+def get_cached_token(cache_key, generate_token, refresh_ahead=60, lock_timeout=30):
+    """Return a provider access token shared by all workers through the Frappe cache.
+
+    `generate_token` must return a `(token, expires_in)` tuple, `expires_in` being in seconds.
+    The token is refreshed `refresh_ahead` seconds before it expires. Only the worker holding
+    the refresh lock calls `generate_token`, the others wait for it and read the new token.
+    """
+    cache = frappe.cache()
+    if token := _get_unexpired_token(cache, cache_key, refresh_ahead):
+        return token
+
+    lock = cache.lock(cache.make_key(f"{cache_key}|refresh"), timeout=lock_timeout)
+    if not lock.acquire(blocking_timeout=lock_timeout):
+        # whoever holds the lock is stuck, don't hold up the payment for it
+        return generate_token()[0]
+
+    try:
+        if token := _get_unexpired_token(cache, cache_key, refresh_ahead):
+            return token
+
+        token, expires_in = generate_token()
+        cache.set_value(
+            cache_key,
+            {"token": token, "expires_at": time.time() + expires_in},
+            expires_in_sec=int(expires_in),
+        )
+        return token
+    finally:
+        with suppress(LockError):
+            lock.release()
+
+
+def _get_unexpired_token(cache, cache_key, refresh_ahead):
+    cached = cache.get_value(cache_key)
+    if cached and cached["expires_at"] - refresh_ahead > time.time():
+        return cached["token"]
+
+
 def get_payment_gateway_controller(payment_gateway):
-    """Return payment gateway controller"""
+    """Return payment gateway controller
+
+    The controller's doctype and name are cached per gateway and the document itself
+    comes from the document cache, so resolving a controller normally runs no queries.
+    """
+    doctype, name = frappe.cache().hget(
+        PAYMENT_GATEWAY_CONTROLLERS_KEY,
+        payment_gateway,
+        lambda: get_payment_gateway_controller_name(payment_gateway),
+    )
+
+    try:
+        return frappe.get_cached_doc(doctype, name)
+    except frappe.DoesNotExistError:
+        clear_payment_gateway_controller_cache()
+        frappe.throw(_("{0} Settings not found").format(payment_gateway))
+
+
+def get_payment_gateway_controller_name(payment_gateway):
+    """Return the `(doctype, name)` of the payment gateway controller"""
     # Special handling for Manual Payment - use Code Payment Gateways
     if payment_gateway == "Manual Payment":
-        try:
-            # Get first enabled Code Payment Gateways record
-            code_gateway_name = frappe.db.get_value(
-                "Code Payment Gateways",
-                {"enabled": 1},
-                "name",
-                order_by="creation desc"
-            )
-            if code_gateway_name:
-                return frappe.get_doc("Code Payment Gateways", code_gateway_name)
-            else:
-                frappe.throw(
-                    _("No enabled Code Payment Gateways found. Please enable one first."))
-        except Exception as e:
+        # Get first enabled Code Payment Gateways record
+        code_gateway_name = frappe.db.get_value(
+            "Code Payment Gateways",
+            {"enabled": 1},
+            "name",
+            order_by="creation desc"
+        )
+        if not code_gateway_name:
             frappe.throw(
-                _("Code Payment Gateways not found: {0}").format(str(e)))
+                _("No enabled Code Payment Gateways found. Please enable one first."))
+        return "Code Payment Gateways", code_gateway_name
+
+    gateway = frappe.db.get_value(
+        "Payment Gateway", payment_gateway, ["gateway_settings", "gateway_controller"], as_dict=True
+    )
+    if not gateway:
+        frappe.throw(_("Payment Gateway {0} not found").format(payment_gateway), frappe.DoesNotExistError)
 
-    gateway = frappe.get_doc("Payment Gateway", payment_gateway)
     if gateway.gateway_controller is None:
-        try:
-            return frappe.get_doc(f"{payment_gateway} Settings")
-        except Exception:
-            frappe.throw(_("{0} Settings not found").format(payment_gateway))
-    else:
-        try:
-            return frappe.get_doc(gateway.gateway_settings, gateway.gateway_controller)
-        except Exception:
-            frappe.throw(_("{0} Settings not found").format(payment_gateway))
+        return f"{payment_gateway} Settings", f"{payment_gateway} Settings"
+
+    return gateway.gateway_settings, gateway.gateway_controller
+
+
+def clear_payment_gateway_controller_cache(doc=None, method=None):
+    frappe.cache().delete_value(PAYMENT_GATEWAY_CONTROLLERS_KEY)
+
+
+def get_checkout_context(settings_doctype, gateway_controller=None):
+    """Return the static checkout fields of a gateway controller, cached until its settings are saved"""
+    gateway_controller = gateway_controller or settings_doctype
+
+    def _get_checkout_context():
+        return frappe.db.get_value(
+            settings_doctype, gateway_controller, CHECKOUT_CONTEXT_FIELDS[settings_doctype], as_dict=True
+        ) or frappe._dict()
+
+    return frappe.cache().hget(
+        CHECKOUT_CONTEXT_KEY, f"{settings_doctype}::{gateway_controller}", _get_checkout_context
+    )
+
+
+def clear_checkout_context_cache(doc=None, method=None):
+    frappe.cache().delete_value(CHECKOUT_CONTEXT_KEY)
 
 
 @frappe.whitelist(allow_guest=True, xss_safe=True)
@@ -163,6 +367,8 @@ def make_custom_fields():
 
         frappe.clear_cache(doctype="Web Form")
 
+    make_integration_request_fields()
+
     if "erpnext" in frappe.get_installed_apps():
         custom_fields = {
             "GoCardless Mandate": [
@@ -181,7 +387,23 @@ def make_custom_fields():
         create_custom_fields(custom_fields)
 
 
+def make_integration_request_fields():
+    """Custom fields on Integration Request used by the payment gateways"""
+    create_custom_fields(
+        {"Integration Request": INTEGRATION_REQUEST_CUSTOM_FIELDS}, update=True
+    )
+
+
 def delete_custom_fields():
+    frappe.db.delete(
+        "Custom Field",
+        {
+            "dt": "Integration Request",
+            "fieldname": ("in", [df["fieldname"] for df in INTEGRATION_REQUEST_CUSTOM_FIELDS]),
+        },
+    )
+    frappe.clear_cache(doctype="Integration Request")
+
     if not frappe.get_meta("Web Form").has_field("payments_tab"):
         return
 
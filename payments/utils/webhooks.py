@@ -0,0 +1,194 @@
+"""
+Ledger of incoming webhook events, kept as Integration Requests.
+
+Each event is stored, flagged as `webhook_event`, under a name derived from the provider's
+own event key. A redelivered event collides with the stored one and is acknowledged without
+being processed again once it is Completed or waiting in the queue; Failed events, and events
+whose job was lost, are processed again. Processing outcomes are kept in the Integration
+Request status. Duplicate deliveries are only counted in the cache, so their count is
+best-effort and starts over when the cache is flushed.
+"""
+
+import hashlib
+
+import frappe
+from frappe.integrations.utils import create_request_log
+from frappe.utils.background_jobs import is_job_enqueued
+
+from payments.utils.utils import bulk_create_request_logs
+
+DUPLICATES_CACHE_KEY = "payments_webhook_duplicates"
+
+
+def get_webhook_event_name(service_name, event_key, data=None):
+	"""Integration Request name for an event, hashed from the payload if the provider sends no key"""
+	if not event_key:
+		event_key = hashlib.sha256(frappe.as_json(data).encode()).hexdigest()
+
+	name = f"{service_name}-{event_key}"
+	if len(name) > 140:
+		name = f"{service_name}-{hashlib.sha256(str(event_key).encode()).hexdigest()}"
+
+	return name
+
+
+def get_webhook_event_job_id(name):
+	return f"webhook_event_{name}"
+
+
+def is_duplicate(name, status):
+	"""A stored event is only a duplicate once it is processed or waiting in the queue"""
+	return status == "Completed" or (status == "Queued" and is_job_enqueued(get_webhook_event_job_id(name)))
+
+
+def record_webhook_event(service_name, event_key, data, request_description=None):
+	"""Store an incoming event.
+
+	Returns the name of the Integration Request to process, or None if the event is a duplicate.
+	"""
+	name = get_webhook_event_name(service_name, event_key, data)
+	if status := frappe.db.get_value("Integration Request", name, "status"):
+		if is_duplicate(name, status):
+			count_duplicates(service_name)
+			return None
+
+		# failed or never enqueued, process it again
+		set_webhook_event_status([name], "Queued")
+		frappe.db.commit()
+		return name
+
+	try:
+		create_request_log(
+			data,
+			service_name=service_name,
+			name=name,
+			request_description=request_description,
+			is_remote_request=1,
+			webhook_event=1,
+		)
+	except frappe.DuplicateEntryError:
+		# the same event is being delivered concurrently
+		count_duplicates(service_name)
+		return None
+
+	frappe.db.commit()
+	return name
+
+
+def record_webhook_events(service_name, events, request_description=None):
+	"""Store a batch of `(event_key, data)` events with one lookup and one insert.
+
+	Nothing is committed, so the events are only recorded together with whatever the
+	caller does with them. Returns a dict of the Integration Request names to process
+	to their data.
+	"""
+	events_by_name = {
+		get_webhook_event_name(service_name, event_key, data): data for event_key, data in events
+	}
+	if not events_by_name:
+		return {}
+
+	existing = dict(
+		frappe.get_all(
+			"Integration Request",
+			filters={"name": ("in", list(events_by_name))},
+			fields=["name", "status"],
+			as_list=True,
+		)
+	)
+	new_events = {
+		name: data
+		for name, data in events_by_name.items()
+		if name not in existing or not is_duplicate(name, existing[name])
+	}
+
+	count_duplicates(service_name, len(events) - len(new_events))
+	bulk_create_request_logs(
+		[(name, data, None) for name, data in new_events.items() if name not in existing],
+		service_name,
+		request_description=request_description,
+		is_remote_request=1,
+		webhook_event=1,
+	)
+	set_webhook_event_status([name for name in new_events if name in existing], "Queued")
+
+	return new_events
+
+
+def enqueue_webhook_event(name, handler, queue="default", timeout=None):
+	"""Process a stored event in the background with `handler(doctype, docname)`"""
+	frappe.enqueue(
+		"payments.utils.webhooks.process_webhook_event",
+		queue=queue,
+		timeout=timeout,
+		job_id=get_webhook_event_job_id(name),
+		deduplicate=True,
+		name=name,
+		handler=handler,
+	)
+
+
+def process_webhook_event(name, handler):
+	if frappe.db.get_value("Integration Request", name, "status") != "Queued":
+		return
+
+	try:
+		frappe.get_attr(handler)(doctype="Integration Request", docname=name)
+	except Exception:
+		frappe.db.rollback()
+		set_webhook_event_status([name], "Failed", error=frappe.get_traceback())
+		frappe.log_error(title=f"Webhook Event {name} failed")
+	else:
+		# keep any status the handler set on the request itself
+		if frappe.db.get_value("Integration Request", name, "status") == "Queued":
+			set_webhook_event_status([name], "Completed")
+
+	frappe.db.commit()
+
+
+def set_webhook_event_status(names, status, error=None):
+	if names:
+		frappe.db.set_value(
+			"Integration Request", {"name": ("in", names)}, {"status": status, "error": error}
+		)
+
+
+def count_duplicates(service_name, count=1):
+	if count:
+		cache = frappe.cache()
+		cache.hincrby(cache.make_key(DUPLICATES_CACHE_KEY), service_name, count)
+
+
+@frappe.whitelist()
+def get_webhook_event_counts(service_name=None):
+	"""Return the number of processed, failed, pending and duplicate webhook events.
+
+	Duplicates are counted in the cache since its last flush, the rest from the ledger.
+	"""
+	frappe.only_for("System Manager")
+
+	filters = {"webhook_event": 1}
+	if service_name:
+		filters["integration_request_service"] = service_name
+
+	by_status = dict(
+		frappe.get_all(
+			"Integration Request",
+			filters=filters,
+			fields=["status", "count(name) as count"],
+			group_by="status",
+			as_list=True,
+		)
+	)
+
+	cache = frappe.cache()
+	duplicates = cache.hgetall(cache.make_key(DUPLICATES_CACHE_KEY)) or {}
+	if service_name:
+		duplicates = {service_name: duplicates.get(service_name.encode(), 0)}
+
+	return {
+		"processed": by_status.get("Completed", 0),
+		"failed": by_status.get("Failed", 0),
+		"pending": by_status.get("Queued", 0),
+		"duplicates": sum(int(count) for count in duplicates.values()),
+	}